@@ -1,344 +1,202 @@
-import pygame
-import random
+import queue
+import sys
+import threading
 import time
-from collections import defaultdict
+
+import WFC_generator
+import WFC_replay
+import WFC_ruleset
+
+try:
+    import pygame
+except ImportError:
+    # Без pygame окна нет, но generate_map() по-прежнему работает
+    pygame = None
 
 TILE_SIZE = 12
 GRID_SIZE = 50
 WINDOW_SIZE = TILE_SIZE * GRID_SIZE
-FPS = 10
-
-TILE_PERCENTAGE_RANGES = {
-    'G': (15, 25),  # Трава
-    'W': (15, 25),  # Вода
-    'D': (10, 20),  # Земля
-    'F': (10, 20),  # Лес
-    'M': (10, 20),  # Низкие горы
-    'H': (0, 5),  # Высокие горы
-    'R': (0, 5),  # Дорога
-}
-
-tile_adjacency = {
-    'G': ['G', 'W', 'D', 'F', 'M', 'R'],
-    'W': ['W', 'G', 'F'],
-    'D': ['D', 'G', 'R'],
-    'F': ['F', 'G', 'M', 'W'],
-    'M': ['M', 'F', 'G', 'H'],
-    'H': ['H', 'M'],
-    'R': ['R', 'D', 'G'],
-}
-
-tile_colors = {
-    'G': (0, 200, 0),  # трава
-    'W': (0, 150, 255),  # вода
-    'D': (139, 69, 19),  # земля
-    'F': (34, 139, 34),  # лес
-    'M': (120, 120, 120),  # низкие горы
-    'H': (70, 70, 70),  # высокие горы
-    'R': (255, 215, 0),  # дорога
-    'S': (237, 201, 175),  # песок
-    '?': (180, 180, 180)  # неопределённая клетка
-}
-
-# Исключаем песок из начальных возможных тайлов
-tile_types = ['G', 'W', 'D', 'F', 'M', 'H', 'R']
-grid = [[tile_types.copy() for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-total_cells = GRID_SIZE * GRID_SIZE
-
-tile_counts = defaultdict(int)
-
-
-def is_collapsed(cell):
-    return len(cell) == 1
-
-
-def update_tile_counts(x, y, new_tile, old_tiles):
-    #Обновляет счетчик тайлов при коллапсе клетки
-    if is_collapsed(old_tiles):
-        old_tile = old_tiles[0]
-        tile_counts[old_tile] -= 1
-
-    tile_counts[new_tile] += 1
-
-
-def check_percentage_limits(tile_type):
-    #Проверяет, не превышены ли процентные ограничения для данного типа тайла
-    if tile_type not in TILE_PERCENTAGE_RANGES:
-        return True
-
-    current_percent = (tile_counts[tile_type] / total_cells) * 100
-    min_p, max_p = TILE_PERCENTAGE_RANGES[tile_type]
-
-    return current_percent < max_p
-
-
-def get_available_tiles(x, y):
-    # доступные тайлы для клетки с учетом процентных ограничений
-    options = grid[y][x]
-
-    # Если клетка уже занята, возвращаем её текущий тайл
-    if is_collapsed(options):
-        return options
-
-    # Если это не часть заранее сгенерированной дороги, убираем дорогу из вариантов
-    if (x, y) not in road_path_coords:
-        options = [tile for tile in options if tile != 'R']
-
-    # те тайлы, которые не превысили свои процентные ограничения
-    available_tiles = [tile for tile in options if check_percentage_limits(tile)]
-
-    # Если все тайлы превысили лимит, возвращаем все варианты, чтобы избежать тупика
-    if not available_tiles:
-        return options
-
-    return available_tiles
-
-
-def convert_to_high_mountains():
-    # Преобразует низкие горы в высокие, если они окружены горами или краем карты
-    for y in range(GRID_SIZE):
-        for x in range(GRID_SIZE):
-            if is_collapsed(grid[y][x]) and grid[y][x][0] == 'M':
-                # Проверяем 4 направления
-                surrounded = True
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < GRID_SIZE and 0 <= ny < GRID_SIZE:
-                        if not is_collapsed(grid[ny][nx]) or grid[ny][nx][0] not in ['M', 'H']:
-                            surrounded = False
-                            break
-
-                if surrounded:
-                    grid[y][x] = ['H']
-                    tile_counts['M'] -= 1
-                    tile_counts['H'] += 1
-
-
-def convert_water_to_sand():
-    # Преобразует воду в песок, если она граничит с дорогой и выполняется условие:
-    # Клетка воды не единственная (есть соседние клетки воды)
-    water_to_sand = []
-
-    for y in range(GRID_SIZE):
-        for x in range(GRID_SIZE):
-            if is_collapsed(grid[y][x]) and grid[y][x][0] == 'W':
-                # Проверяем, есть ли соседи-дороги
-                has_road_neighbor = False
-                road_positions = []
-
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < GRID_SIZE and 0 <= ny < GRID_SIZE:
-                        if is_collapsed(grid[ny][nx]) and grid[ny][nx][0] == 'R':
-                            has_road_neighbor = True
-                            road_positions.append((nx, ny))
-
-                if has_road_neighbor:
-                    # Проверяем условие: есть ли соседние клетки воды
-                    has_water_neighbor = False
-                    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                        nx, ny = x + dx, y + dy
-                        if 0 <= nx < GRID_SIZE and 0 <= ny < GRID_SIZE:
-                            if is_collapsed(grid[ny][nx]) and grid[ny][nx][0] == 'W':
-                                has_water_neighbor = True
-                                break
-
-                    # Если условие выполняются, добавляем в список на замену
-                    if has_water_neighbor:
-                        water_to_sand.append((x, y))
-
-    # Заменяем отмеченные клетки воды на песок
-    for x, y in water_to_sand:
-        grid[y][x] = ['S']
-        tile_counts['W'] -= 1
-        tile_counts['S'] += 1
-
-
-def collapse_cell(x, y):
-    if is_collapsed(grid[y][x]):
-        return
-
-    options = get_available_tiles(x, y)
-
-    # Убираем дорогу, если она бы образовала перекресток
-    if 'R' in options and too_many_road_neighbors(x, y):
-        options = [opt for opt in options if opt != 'R']
-
-    if not options:
-        options = ['G']  # fallback
-
-    chosen_tile = random.choice(options)
-    old_tiles = grid[y][x].copy()
-    grid[y][x] = [chosen_tile]
-    update_tile_counts(x, y, chosen_tile, old_tiles)
-
-
-def get_neighbors(x, y):
-    neighbors = []
-    if x > 0: neighbors.append((x - 1, y))
-    if x < GRID_SIZE - 1: neighbors.append((x + 1, y))
-    if y > 0: neighbors.append((x, y - 1))
-    if y < GRID_SIZE - 1: neighbors.append((x, y + 1))
-    return neighbors
-
-
-def propagate(x, y):
-    stack = [(x, y)]
-    while stack:
-        # берём клетку из стека
-        cx, cy = stack.pop()
-        current_options = grid[cy][cx]
-
-        # проверяем всех её соседей
-        for nx, ny in get_neighbors(cx, cy):
-            neighbor_options = grid[ny][nx]
-
-            # пропускаем уже коллапсированные клетки
-            if is_collapsed(neighbor_options):
-                continue
-
-            # собираем ВСЕ возможные тайлы, которые могут быть у соседа
-            valid_neighbor_tiles = set()
-
-            for neighbor_tile in neighbor_options:
-                # Проверяем, есть ли хотя бы один тайл в current_options,
-                # который допускает neighbor_tile как соседа
-                compatible = any(
-                    neighbor_tile in tile_adjacency.get(option, []) for option in current_options
-                )
-                if compatible:
-                    valid_neighbor_tiles.add(neighbor_tile)
-
-            # если список допустимых тайлов изменился — обновляем соседа
-            if valid_neighbor_tiles and valid_neighbor_tiles != set(neighbor_options):
-                grid[ny][nx] = list(valid_neighbor_tiles)
-                stack.append((nx, ny)) # добавляем в стек для дальнейшего распространения
-
-
-def generate_road_path():
-    start = (random.randint(0, GRID_SIZE - 1), 0)  # Верхняя граница
-    end = (random.randint(0, GRID_SIZE - 1), GRID_SIZE - 1)  # Нижняя граница
-
-    path = [start]
-
-    x, y = start
-    while (x, y) != end:
-        # Выбираем направление движения: вниз, влево или вправо, чтобы приблизиться к end
-        moves = []
-        if y < end[1]:
-            moves.append((x, y + 1))  # вниз
-        if x > end[0]:
-            moves.append((x - 1, y))  # влево
-        if x < end[0]:
-            moves.append((x + 1, y))  # вправо
-
-        next_cell = random.choice(moves)
-        if next_cell not in path:
-            path.append(next_cell)
-            x, y = next_cell
-        else:
-            break  # чтобы не зациклиться
-
-    return path
-
-
-road_path_coords = set()
-
-
-def place_road(path):
-    global road_path_coords
-    road_path_coords = set(path)  # Сохраняем координаты дороги для проверки
-    for (x, y) in path:
-        grid[y][x] = ['R']
-        tile_counts['R'] += 1
-
-
-def too_many_road_neighbors(x, y):
-    # Проверяет, не делает ли дорога перекресток или квадрат
-    count = 0
-    for nx, ny in get_neighbors(x, y):
-        if is_collapsed(grid[ny][nx]) and grid[ny][nx][0] == 'R':
-            count += 1
-    return count >= 2
-
-
-def find_lowest_entropy_cell():
-    min_entropy = float('inf')
-    candidates = []
-
-    for y in range(GRID_SIZE):
-        for x in range(GRID_SIZE):
-            options = grid[y][x]
-            if not is_collapsed(options):
-                entropy = len(options)
-                if entropy < min_entropy:
-                    min_entropy = entropy
-                    candidates = [(x, y)]
-                elif entropy == min_entropy:
-                    candidates.append((x, y))
-
-    return random.choice(candidates) if candidates else None
-
-
-def draw_grid(screen):
-    for y in range(GRID_SIZE):
-        for x in range(GRID_SIZE):
-            cell = grid[y][x]
-            if len(cell) == 1:
-                color = tile_colors[cell[0]]
-            else:
-                color = tile_colors['?']
-            pygame.draw.rect(screen, color, (x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
-            pygame.draw.rect(screen, (50, 50, 50), (x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE), 1)
+FPS = 30
+# Как часто (в миллисекундах) фоновый решатель отдаёт накопленные изменения окну
+PUBLISH_INTERVAL_MS = 20
+DRAW_GRID_LINES = True
+# Сколько городов внутри карты соединяет дорожная сеть, кроме концов дороги на краях
+ROAD_TOWNS = 0
+# Режим правки готовой карты: клавиши 1-9 выбирают тайл по порядку в наборе правил,
+# 0 - ластик; левая кнопка мыши рисует кистью радиуса BRUSH_RADIUS,
+# правая - прямоугольник. Отмеченная область перерешивается при отпускании кнопки
+BRUSH_RADIUS = 2
+# Просмотр журнала коллапсов (WFC_replay.py): python WFC.py generated_map.txt.wfcl.
+# Пробел - пауза, стрелки вверх/вниз - скорость вдвое больше/меньше, влево/вправо -
+# шаг назад/вперёд, Home/End - начало/конец, левая кнопка мыши - перемотка:
+# позиция по горизонтали - доля журнала. PLAYBACK_SPEED - шагов журнала за кадр
+PLAYBACK_SPEED = 16
+
+# Тайлы, процентные ограничения, соседство и постобработка - из rulesets/full.json, см. WFC_ruleset.py
+RULESET = WFC_ruleset.load_ruleset('full')
+TILE_PERCENTAGE_RANGES = RULESET.percentage_ranges
+BIT_TILES = RULESET.bit_tiles
+tile_colors = dict(RULESET.colors)
+tile_colors['?'] = (180, 180, 180)  # неопределённая клетка
+
+# Решатель карты в окне (WFC_generator.py), создаётся в main() или generate_map()
+generator = None
+
+
+# Индексы цветов в палитре поверхности клеток
+palette_index = {tile: i for i, tile in enumerate(tile_colors)}
+# Тайлы для кисти по клавишам 1-9
+paint_tiles = [tile for tile in tile_colors if tile != '?']
+
+
+def create_cell_surface(width=GRID_SIZE, height=GRID_SIZE):
+    # 8-битная поверхность: один пиксель на клетку, цвет - индекс в палитре
+    surface = pygame.Surface((width, height), depth=8)
+    surface.set_palette(list(tile_colors.values()))
+    surface.fill(palette_index['?'])
+    return surface
+
+
+def create_grid_lines(width=GRID_SIZE, height=GRID_SIZE, tile_size=TILE_SIZE):
+    # Сетка рисуется один раз на прозрачной поверхности и накладывается поверх клеток
+    right, bottom = width * tile_size - 1, height * tile_size - 1
+    lines = pygame.Surface((right + 1, bottom + 1))
+    lines.fill((0, 0, 0))
+    lines.set_colorkey((0, 0, 0))
+    for i in range(width):
+        for offset in (i * tile_size, i * tile_size + tile_size - 1):
+            pygame.draw.line(lines, (50, 50, 50), (offset, 0), (offset, bottom))
+    for i in range(height):
+        for offset in (i * tile_size, i * tile_size + tile_size - 1):
+            pygame.draw.line(lines, (50, 50, 50), (0, offset), (right, offset))
+    return lines
+
+
+def draw_changes(screen, cell_surface, grid_lines, changes, tile_size=TILE_SIZE):
+    # Забирает из очереди все пачки изменений (x, y, домен) и обновляет на экране
+    # только прямоугольник вокруг них. Возвращает его для pygame.display.update()
+    events = []
+    while True:
+        try:
+            events.extend(changes.get_nowait())
+        except queue.Empty:
+            break
+    if not events:
+        return None
+
+    with pygame.PixelArray(cell_surface) as pixels:
+        for x, y, cell in events:
+            pixels[x, y] = palette_index[BIT_TILES[cell]] if WFC_generator.is_collapsed(cell) else palette_index['?']
+
+    xs = [x for x, _, _ in events]
+    ys = [y for _, y, _ in events]
+    area = pygame.Rect(min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+
+    screen_area = pygame.Rect(area.x * tile_size, area.y * tile_size, area.w * tile_size, area.h * tile_size)
+    screen.blit(pygame.transform.scale(cell_surface.subsurface(area), screen_area.size), screen_area)
+    if grid_lines:
+        screen.blit(grid_lines, screen_area, screen_area)
+    return screen_area
+
+
+def publish_changes(changes):
+    # Отдаёт окну накопленные изменения одной пачкой
+    batch = generator.take_changes()
+    if batch:
+        changes.put(batch)
+
+
+def solver_worker(changes, stop_event, log):
+    # Генерация в отдельном потоке: окно видит только пачки изменений из очереди.
+    # Готовая карта сохраняется вместе с журналом коллапсов log
+    finished = False
+    while not finished and not stop_event.is_set():
+        deadline = time.perf_counter() + PUBLISH_INTERVAL_MS / 1000
+        while not finished and time.perf_counter() < deadline:
+            finished = not generator.step()
+        publish_changes(changes)
+
+    if finished:
+        generator.finish()
+        publish_changes(changes)
+        save_map_to_file()
+        log.write("generated_map.txt.wfcl")
+        print("Журнал коллапсов сохранён в generated_map.txt.wfcl")
 
 
 def print_tile_percentages():
     # Выводит текущее процентное соотношение тайлов
     print("\nCurrent tile percentages:")
     for tile in TILE_PERCENTAGE_RANGES:
-        percent = (tile_counts[tile] / total_cells) * 100
+        percent = (generator.tile_counts[tile] / generator.total_cells) * 100
         print(f"{tile}: {percent:.1f}%")
     print()
 
 
-def run_wfc_step():
-    cell = find_lowest_entropy_cell()
-    if cell:
-        x, y = cell
-        collapse_cell(x, y)
-        propagate(x, y)
-        return True
-    return False
-
 def save_map_to_file(filename="generated_map.txt"):
     with open(filename, 'w') as f:
-        for y in range(GRID_SIZE):
-            for x in range(GRID_SIZE):
-                # Берём элемент из списка тайлов клетки
-                tile = grid[y][x][0] if grid[y][x] else '?'
-                f.write(tile)
-            f.write('\n')  # Переход на новую строку для каждой строки сетки
+        f.write('\n'.join(generator.map_rows()) + '\n')
     print(f"Карта успешно сохранена в файл {filename}")
 
+
+def cell_at(position):
+    x, y = position
+    return min(x // TILE_SIZE, GRID_SIZE - 1), min(y // TILE_SIZE, GRID_SIZE - 1)
+
+
+def apply_edit(changes, cells, tile):
+    # Правка карты в окне (WFC_generator.WFCGenerator.edit): решатель к этому
+    # моменту уже закончил работу, так что карту трогает только окно
+    start = time.perf_counter()
+    solved = generator.edit(cells, tile)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Правка {tile or 'ластик'}: {len(cells)} клеток, перерешено {len(solved)} за {elapsed:.1f} мс")
+    publish_changes(changes)
+
+
+def generate_map(seed=None):
+    # Генерация карты целиком без окна: дорога, WFC и постобработка
+    global generator
+    generator = WFC_generator.WFCGenerator(RULESET, GRID_SIZE, GRID_SIZE, seed, ROAD_TOWNS)
+    generator.run()
+    return generator
+
+
 def main():
+    global generator
     pygame.init()
     screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
     pygame.display.set_caption("Wave Function Collapse with Sand Beaches")
     clock = pygame.time.Clock()
     running = True
-    finished_generation = False
 
-    # 1) Генерируем путь дороги
-    road_path = generate_road_path()
-    place_road(road_path)
+    cell_surface = create_cell_surface()
+    grid_lines = create_grid_lines() if DRAW_GRID_LINES else None
+
+    # 1) Прокладываем дороги
+    log = WFC_replay.CollapseLog()
+    generator = WFC_generator.WFCGenerator(RULESET, GRID_SIZE, GRID_SIZE, towns=ROAD_TOWNS, log=log)
+    generator.track_changes()
+    generator.start()
+
+    # Первый кадр рисуется целиком, дальше - только изменения
+    changes = queue.Queue()
+    publish_changes(changes)
+
+    # 2) Запускаем WFC для остальных клеток в фоновом потоке
+    stop_event = threading.Event()
+    solver = threading.Thread(target=solver_worker, args=(changes, stop_event, log), daemon=True)
+    solver.start()
 
-    # 2) Запускаем WFC для остальных клеток
-    map_saved = False  # Добавьте флаг вне цикла
+    # Правка: выбранный тайл (None - ластик), клетки штриха кисти и угол прямоугольника
+    paint_tile = paint_tiles[0]
+    stroke = set()
+    corner = None
 
     while running:
-        screen.fill((0, 0, 0))
-        draw_grid(screen)
-        pygame.display.flip()
+        dirty = draw_changes(screen, cell_surface, grid_lines, changes)
+        if dirty:
+            pygame.display.update(dirty)
         clock.tick(FPS)
 
         for event in pygame.event.get():
@@ -347,20 +205,108 @@ def main():
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_p:
                     print_tile_percentages()
-
-        if not finished_generation:
-            finished_generation = not run_wfc_step()
-        elif finished_generation and not map_saved:
-            convert_to_high_mountains()
-            convert_water_to_sand()
-            save_map_to_file()
-            map_saved = True  # Чтобы больше не сохранялось
-            finished_generation = False  # Чтобы не вызывать функцию каждый кадр
+                elif event.key == pygame.K_0:
+                    paint_tile = None
+                elif pygame.K_1 <= event.key <= pygame.K_9 and event.key - pygame.K_1 < len(paint_tiles):
+                    paint_tile = paint_tiles[event.key - pygame.K_1]
+            elif solver.is_alive():
+                # Пока карта генерируется, мышь не правит её
+                continue
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                stroke.update(generator.brush(*cell_at(event.pos), BRUSH_RADIUS))
+            elif event.type == pygame.MOUSEMOTION and event.buttons[0]:
+                stroke.update(generator.brush(*cell_at(event.pos), BRUSH_RADIUS))
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and stroke:
+                apply_edit(changes, stroke, paint_tile)
+                stroke = set()
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+                corner = cell_at(event.pos)
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3 and corner:
+                apply_edit(changes, generator.rectangle(*corner, *cell_at(event.pos)), paint_tile)
+                corner = None
+
+    # Решатель останавливается после текущего шага, ждать его не нужно
+    stop_event.set()
 
     # После завершения выводим итоговые проценты
     print_tile_percentages()
     pygame.quit()
 
 
+def play_log(filename):
+    # Проигрывание журнала коллапсов: карта на любом шаге восстанавливается
+    # WFC_replay.Replayer без поиска клеток, так что скорость и перемотка любые
+    global generator
+    log = WFC_replay.read_log(filename)
+    if log.meta['depth'] > 1:
+        raise SystemExit("объёмные карты окно не показывает, используйте WFC_replay.py")
+    replayer = WFC_replay.Replayer(log, track_changes=True)
+    generator = replayer.generator
+    width, height = generator.width, generator.height
+    tile_size = max(1, min(TILE_SIZE, WINDOW_SIZE // max(width, height)))
+
+    pygame.init()
+    screen = pygame.display.set_mode((width * tile_size, height * tile_size))
+    clock = pygame.time.Clock()
+    cell_surface = create_cell_surface(width, height)
+    grid_lines = create_grid_lines(width, height, tile_size) if DRAW_GRID_LINES and tile_size > 2 else None
+    changes = queue.Queue()
+
+    # Шаг, который нужно показать, скорость в шагах за кадр и пауза
+    target = 0
+    speed = PLAYBACK_SPEED
+    playing = True
+    running = True
+    while running:
+        if playing:
+            target = min(target + speed, replayer.steps)
+            playing = target < replayer.steps
+        if target != replayer.position:
+            replayer.seek(target)
+        if target == replayer.steps and not generator.finished:
+            matched = replayer.finish()
+            print(f"Журнал проигран до конца, карта {'совпала' if matched else 'НЕ совпала'} с записанной")
+        publish_changes(changes)
+        pygame.display.set_caption(f"{filename}: шаг {replayer.position} из {replayer.steps}, "
+                                   f"{speed} шагов за кадр{'' if playing else ', пауза'}")
+
+        dirty = draw_changes(screen, cell_surface, grid_lines, changes, tile_size)
+        if dirty:
+            pygame.display.update(dirty)
+        clock.tick(FPS)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    playing = not playing
+                    if target == replayer.steps:
+                        target = 0
+                elif event.key == pygame.K_UP:
+                    speed *= 2
+                elif event.key == pygame.K_DOWN:
+                    speed = max(1, speed // 2)
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    playing = False
+                    target = max(0, min(target + (1 if event.key == pygame.K_RIGHT else -1), replayer.steps))
+                elif event.key == pygame.K_HOME:
+                    target = 0
+                elif event.key == pygame.K_END:
+                    target = replayer.steps
+                elif event.key == pygame.K_p:
+                    print_tile_percentages()
+            elif (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1
+                  or event.type == pygame.MOUSEMOTION and event.buttons[0]):
+                playing = False
+                x = max(0, min(event.pos[0], screen.get_width() - 1))
+                target = x * replayer.steps // (screen.get_width() - 1 or 1)
+
+    pygame.quit()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        play_log(sys.argv[1])
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,297 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import WFC_generator
+import WFC_txt
+import WFC_txt_easy
+
+# Замеры скорости генераторов на фиксированных seed и размерах карт.
+#   python WFC_bench.py --save baseline.json           - замерить и сохранить базовую линию
+#   python WFC_bench.py --compare baseline.json        - сравнить, код возврата 1 при регрессии
+# Для каждого случая (генератор, размер) считаются клетки в секунду (медиана всех
+# REPEAT запусков на каждом seed),
+# доли времени на поиск клетки, распространение и постобработку, пиковая память
+# и доля противоречий. Базовая линия зависит от машины, сравнивать имеет смысл
+# замеры, сделанные на одном и том же компьютере
+
+SIZES = [50, 100, 200, 500, 1000]
+SEEDS = [1, 2, 3]
+# Сколько раз повторять генерацию на каждом seed: скорость - медиана всех запусков,
+# одиночный выброс её не сдвигает. Время - процессорное (process_time), на нагруженной
+# машине оно заметно стабильнее настенного. Перед замерами каждый генератор один раз
+# прогревается на маленькой карте WARMUP_SIZE, чтобы первый случай не платил за импорты и кеши
+REPEAT = 5
+WARMUP_SIZE = 16
+# Допустимое ухудшение относительно базовой линии: падение клеток в секунду
+# и рост пиковой памяти (доли), записываются в файл базовой линии
+THRESHOLDS = {'cells_per_sec': 0.15, 'peak_memory': 0.25}
+# Допустимое падение скорости, если базовая линия или текущий замер сделаны меньше
+# чем с REPEAT повторами: медиана по нескольким запускам шумит гораздо сильнее
+SHORT_RUN_SPEED_THRESHOLD = 0.4
+
+
+def generate_viewer(size, seed):
+    # Решатель окна WFC.py без окна; с pygame или без него - решатель тот же
+    import WFC
+    WFC.GRID_SIZE = size
+    generator = WFC.generate_map(seed)
+    return generator.map_rows(), generator.backtracks
+
+
+def generate_full(size, seed):
+    WFC_txt.ENGINE = 'python'
+    generator = WFC_txt.generate_map(size, size, seed)
+    return generator.map_rows(), generator.backtracks
+
+
+def generate_full_numpy(size, seed):
+    WFC_txt.ENGINE = 'numpy'
+    try:
+        generator = WFC_txt.generate_map(size, size, seed)
+    finally:
+        WFC_txt.ENGINE = 'python'
+    return generator.map_rows(), 0
+
+
+def generate_multires(size, seed):
+    WFC_txt.MULTIRES_LEVELS = 3
+    try:
+        generator = WFC_txt.generate_map(size, size, seed)
+    finally:
+        WFC_txt.MULTIRES_LEVELS = 0
+    return generator.map_rows(), generator.backtracks
+
+
+def generate_logged(size, seed):
+    # То же, что full, с журналом коллапсов (WFC_replay.py): цена записи журнала
+    WFC_txt.COLLAPSE_LOG = True
+    try:
+        generator = WFC_txt.generate_map(size, size, seed)
+        WFC_txt.collapse_log.encode()
+    finally:
+        WFC_txt.COLLAPSE_LOG = False
+    return generator.map_rows(), generator.backtracks
+
+
+def generate_easy(size, seed):
+    generator = WFC_txt_easy.generate_map(size, size, seed)
+    return generator.map_rows(), generator.backtracks
+
+
+def numpy_hooks():
+    import WFC_numpy
+    return [(WFC_numpy.NumpyEngine, 'find_lowest_entropy_cells', 'entropy'),
+            (WFC_numpy.NumpyEngine, 'propagate', 'propagate'),
+            (WFC_generator.WFCGenerator, 'apply_post_rules', 'post')]
+
+
+GENERATOR_HOOKS = [(WFC_generator.WFCGenerator, 'find_lowest_entropy_cell', 'entropy'),
+                   (WFC_generator.WFCGenerator, 'propagate', 'propagate'),
+                   (WFC_generator.WFCGenerator, 'apply_post_rules', 'post')]
+
+# Генераторы: имя -> (функция генерации, функции, время которых делится по фазам,
+# набор правил для проверки соседства)
+TARGETS = {
+    'viewer': (generate_viewer, lambda: GENERATOR_HOOKS, WFC_txt.RULESET),
+    'full': (generate_full, lambda: GENERATOR_HOOKS, WFC_txt.RULESET),
+    'full-numpy': (generate_full_numpy, numpy_hooks, WFC_txt.RULESET),
+    'full-multires': (generate_multires, lambda: GENERATOR_HOOKS, WFC_txt.RULESET),
+    'full-log': (generate_logged, lambda: GENERATOR_HOOKS, WFC_txt.RULESET),
+    'easy': (generate_easy, lambda: GENERATOR_HOOKS, WFC_txt_easy.RULESET),
+}
+
+
+class PhaseTimer:
+    # Подменяет функции обёртками, которые копят время вызовов по фазам.
+    # Обёртки замедляют генерацию, поэтому скорость меряется отдельным запуском
+
+    def __init__(self, hooks):
+        self.hooks = hooks
+        self.totals = defaultdict(float)
+        self.saved = []
+
+    def wrap(self, function, phase):
+        totals = self.totals
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[phase] += clock() - start
+        return timed
+
+    def __enter__(self):
+        for owner, name, phase in self.hooks:
+            original = getattr(owner, name)
+            self.saved.append((owner, name, original))
+            setattr(owner, name, self.wrap(original, phase))
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self.saved):
+            setattr(owner, name, original)
+        self.saved.clear()
+
+
+def contradiction_rate(rows, ruleset):
+    # Доля пар соседних клеток, нарушающих таблицу соседства, и клеток без тайла.
+    # Тайлы только для постобработки (S) в таблице не участвуют и не проверяются
+    adjacency = {tile: set(allowed) for tile, allowed in ruleset.adjacency.items()}
+    bad = pairs = 0
+    for y, row in enumerate(rows):
+        for x, tile in enumerate(row):
+            if tile == '?':
+                bad += 1
+                continue
+            for nx, ny in ((x + 1, y), (x, y + 1)):
+                if nx < len(row) and ny < len(rows):
+                    other = rows[ny][nx]
+                    pairs += 1
+                    if tile in adjacency and other in adjacency and other not in adjacency[tile]:
+                        bad += 1
+    return bad / max(pairs, 1)
+
+
+def run_case(target, size, seeds, repeat=REPEAT, memory=True):
+    generate, hooks, ruleset = TARGETS[target]
+    cells = size * size
+    speeds = []
+    backtracks = []
+    rates = []
+    generate(WARMUP_SIZE, seeds[0])
+    for seed in seeds:
+        for _ in range(repeat):
+            start = time.process_time()
+            rows, count = generate(size, seed)
+            speeds.append(cells / max(time.process_time() - start, 1e-9))
+        backtracks.append(count)
+        rates.append(contradiction_rate(rows, ruleset))
+
+    # Разбивка по фазам и память - на первом seed, отдельными запусками
+    with PhaseTimer(hooks()) as timer:
+        start = time.perf_counter()
+        generate(size, seeds[0])
+        total = time.perf_counter() - start
+    phases = {phase: timer.totals[phase] / total for phase in ('entropy', 'propagate', 'post')}
+    phases['other'] = max(0.0, 1 - sum(phases.values()))
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        generate(size, seeds[0])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'target': target,
+        'size': size,
+        'cells_per_sec': statistics.median(speeds),
+        'phases': phases,
+        'peak_memory': peak,
+        'backtracks_per_1000_cells': statistics.mean(backtracks) * 1000 / cells,
+        'contradiction_rate': statistics.mean(rates),
+    }
+
+
+def case_name(result):
+    return f"{result['target']}/{result['size']}x{result['size']}"
+
+
+def print_result(result):
+    phases = ' '.join(f"{phase} {share:.0%}" for phase, share in result['phases'].items())
+    memory = f"{result['peak_memory'] / 2 ** 20:.1f} МБ" if result['peak_memory'] is not None else '-'
+    print(f"{case_name(result):<22} {result['cells_per_sec']:>11.0f} кл/с  {memory:>10}  "
+          f"откатов {result['backtracks_per_1000_cells']:.2f}/1000  "
+          f"противоречий {result['contradiction_rate']:.4%}  [{phases}]")
+
+
+def compare(results, baseline, repeat=REPEAT):
+    # Возвращает список регрессий относительно базовой линии. repeat - число повторов
+    # текущего замера; у короткого замера или базовой линии порог скорости шире
+    thresholds = dict(baseline.get('thresholds', THRESHOLDS))
+    if min(repeat, baseline.get('repeat', REPEAT)) < REPEAT:
+        thresholds['cells_per_sec'] = max(thresholds['cells_per_sec'], SHORT_RUN_SPEED_THRESHOLD)
+    old = {case_name(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = old.get(case_name(result))
+        if before is None:
+            continue
+        ratio = result['cells_per_sec'] / before['cells_per_sec']
+        if ratio < 1 - thresholds['cells_per_sec']:
+            regressions.append(f"{case_name(result)}: скорость {ratio:.0%} от базовой")
+        if result['peak_memory'] and before.get('peak_memory'):
+            ratio = result['peak_memory'] / before['peak_memory']
+            if ratio > 1 + thresholds['peak_memory']:
+                regressions.append(f"{case_name(result)}: пиковая память {ratio:.0%} от базовой")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости генераторов WFC")
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=['viewer', 'full', 'easy'],
+                        help="какие генераторы мерить (full-numpy нужен numpy)")
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help="стороны квадратных карт")
+    parser.add_argument('--seeds', nargs='+', type=int, default=SEEDS, help="seed для каждого случая")
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help=f"повторов на каждый seed, берётся медиана; если здесь или в базовой линии "
+                             f"повторов меньше {REPEAT}, --compare допускает падение скорости "
+                             f"до {SHORT_RUN_SPEED_THRESHOLD * 100:.0f}%%")
+    parser.add_argument('--no-memory', action='store_true', help="не мерить пиковую память (быстрее)")
+    parser.add_argument('--save', default=None, help="сохранить результаты как базовую линию в JSON")
+    parser.add_argument('--compare', default=None, help="сравнить с базовой линией из JSON")
+    parser.add_argument('--speed-threshold', type=float, default=THRESHOLDS['cells_per_sec'],
+                        help="допустимое падение скорости для --save (доля)")
+    parser.add_argument('--memory-threshold', type=float, default=THRESHOLDS['peak_memory'],
+                        help="допустимый рост пиковой памяти для --save (доля)")
+    args = parser.parse_args(argv)
+    if any(size <= 0 for size in args.sizes):
+        parser.error("размеры должны быть положительными")
+    if args.repeat <= 0:
+        parser.error("--repeat должен быть положительным")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for target in args.targets:
+        for size in args.sizes:
+            result = run_case(target, size, args.seeds, args.repeat, not args.no_memory)
+            print_result(result)
+            results.append(result)
+
+    if args.save:
+        baseline = {
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'seeds': args.seeds,
+            'repeat': args.repeat,
+            'thresholds': {'cells_per_sec': args.speed_threshold, 'peak_memory': args.memory_threshold},
+            'results': results,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Базовая линия сохранена в {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.repeat)
+        for regression in regressions:
+            print("Регрессия:", regression)
+        if regressions:
+            return 1
+        print("Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
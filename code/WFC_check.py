@@ -0,0 +1,150 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+import WFC_generator
+import WFC_largemap
+import WFC_ruleset
+import WFC_txt
+
+# Проверки качества карт, которых не видно в замерах скорости WFC_bench.py:
+# нарушения соседства там, где их легко пропустить, и доли тайлов.
+#   python WFC_check.py                  - все проверки, код возврата 1 при нарушении
+#   python WFC_check.py --checks bands   - только выбранные
+
+# Карты и seed для проверки швов между полосами WFC_largemap.py
+BAND_CHECK_SIZE = (200, 150)
+BAND_CHECK_SEEDS = [1, 3, 5]
+# Карты и seed для проверки минимальных долей тайлов. Доли усредняются по всем seed:
+# на отдельной карте тайл может не добрать минимум (земля D растёт только у травы
+# и дорог), ограничение должно выполняться в среднем
+MINIMUM_CHECK_SIZE = (200, 150)
+MINIMUM_CHECK_SEEDS = [1, 2, 3, 4, 5]
+# Мир чанков CHUNK_CHECK_SIDE x CHUNK_CHECK_SIDE для проверки швов между чанками
+# WFC_txt.generate_chunk(): чанки генерируются в случайном порядке, так что одни
+# оказываются зажаты соседями с нескольких сторон, другие - только по диагонали
+CHUNK_CHECK_SIDE = 4
+CHUNK_CHECK_SEEDS = [1, 2, 3, 4, 5, 6, 7, 8]
+# Наборы правил, на которых WFCGenerator с настройками по умолчанию должен решать карту
+# без нарушений соседства (easy - набор без тайла дороги)
+RULESET_CHECK_NAMES = ['full', 'easy']
+RULESET_CHECK_SIZE = (40, 20)
+RULESET_CHECK_SEEDS = [1, 2, 3]
+
+
+def adjacency_errors(rows, ruleset, pairs):
+    # Нарушения таблицы соседства среди пар клеток pairs: ((x, y), (nx, ny)).
+    # Тайлы только для постобработки (S) в таблице не участвуют и не проверяются
+    adjacency = {tile: set(allowed) for tile, allowed in ruleset.adjacency.items()}
+    errors = []
+    for (x, y), (nx, ny) in pairs:
+        tile, other = rows[y][x], rows[ny][nx]
+        if tile in adjacency and other in adjacency and other not in adjacency[tile]:
+            errors.append(f"({x}, {y}) {tile} - ({nx}, {ny}) {other}")
+    return errors
+
+
+def check_bands(seeds=BAND_CHECK_SEEDS, size=BAND_CHECK_SIZE, band_rows=WFC_largemap.BAND_ROWS):
+    # Соседство через границы полос карты, решённой по частям (WFC_largemap.generate_to_file)
+    width, height = size
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'bands.txt')
+        for seed in seeds:
+            WFC_largemap.generate_to_file(width, height, seed, filename, band_rows=band_rows)
+            with open(filename) as f:
+                rows = f.read().split()
+            pairs = [((x, y), (x, y + 1)) for y in range(band_rows - 1, height - 1, band_rows) for x in range(width)]
+            errors = adjacency_errors(rows, WFC_txt.RULESET, pairs)
+            if errors:
+                failures.append(f"bands seed {seed}: {len(errors)} нарушений на границах полос, "
+                                f"например {errors[0]}")
+    return failures
+
+
+def check_chunks(seeds=CHUNK_CHECK_SEEDS, side=CHUNK_CHECK_SIDE):
+    # Соседство через швы между чанками бесконечного мира (WFC_txt.generate_chunk)
+    size = WFC_txt.CHUNK_SIZE * side
+    pairs = [((x, y), (x + 1, y)) for x in range(WFC_txt.CHUNK_SIZE - 1, size - 1, WFC_txt.CHUNK_SIZE)
+             for y in range(size)]
+    pairs += [((x, y), (x, y + 1)) for y in range(WFC_txt.CHUNK_SIZE - 1, size - 1, WFC_txt.CHUNK_SIZE)
+              for x in range(size)]
+    failures = []
+    for seed in seeds:
+        world = {}
+        order = [(cx, cy) for cy in range(side) for cx in range(side)]
+        random.Random(seed).shuffle(order)
+        for cx, cy in order:
+            WFC_txt.get_chunk(cx, cy, seed, world)
+        rows = [''.join(world[(cx, cy)][y] for cx in range(side))
+                for cy in range(side) for y in range(WFC_txt.CHUNK_SIZE)]
+        errors = adjacency_errors(rows, WFC_txt.RULESET, pairs)
+        if errors:
+            failures.append(f"chunks seed {seed}: {len(errors)} нарушений на швах чанков, например {errors[0]}")
+    return failures
+
+
+def check_minimums(seeds=MINIMUM_CHECK_SEEDS, size=MINIMUM_CHECK_SIZE, ruleset=WFC_txt.RULESET):
+    # Средние по seed доли тайлов готовой карты (после постобработки) против минимумов
+    # из правил. Максимумы не проверяются: постобработка (M -> H) законно их превышает
+    width, height = size
+    counts = Counter()
+    for seed in seeds:
+        generator = WFC_txt.generate_map(width, height, seed)
+        counts.update(''.join(generator.map_rows()))
+    total = width * height * len(seeds)
+    failures = []
+    for tile, (min_p, _) in ruleset.percentage_ranges.items():
+        percent = counts[tile] * 100 / total
+        if percent < min_p:
+            failures.append(f"minimums {width}x{height}, seed {seeds[0]}-{seeds[-1]}: "
+                            f"{tile} в среднем {percent:.1f}% при минимуме {min_p}%")
+    return failures
+
+
+def check_rulesets(names=RULESET_CHECK_NAMES, seeds=RULESET_CHECK_SEEDS, size=RULESET_CHECK_SIZE):
+    # WFCGenerator на каждом наборе правил: карта решается целиком и без нарушений соседства
+    width, height = size
+    pairs = [((x, y), (x + dx, y + dy)) for y in range(height) for x in range(width)
+             for dx, dy in ((1, 0), (0, 1)) if x + dx < width and y + dy < height]
+    failures = []
+    for name in names:
+        ruleset = WFC_ruleset.load_ruleset(name)
+        for seed in seeds:
+            rows = WFC_generator.WFCGenerator(ruleset, width, height, seed).result()
+            errors = adjacency_errors(rows, ruleset, pairs)
+            unsolved = sum(row.count('?') for row in rows)
+            if errors or unsolved:
+                failures.append(f"rulesets {name} seed {seed}: {len(errors)} нарушений соседства, "
+                                f"{unsolved} клеток без тайла")
+    return failures
+
+
+CHECKS = {
+    'bands': check_bands,
+    'chunks': check_chunks,
+    'minimums': check_minimums,
+    'rulesets': check_rulesets,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверки качества карт WFC")
+    parser.add_argument('--checks', nargs='+', choices=sorted(CHECKS), default=sorted(CHECKS),
+                        help="какие проверки запускать")
+    args = parser.parse_args(argv)
+    failures = []
+    for name in args.checks:
+        found = CHECKS[name]()
+        print(f"{name}: {'ошибки' if found else 'ок'}")
+        failures.extend(found)
+    for failure in failures:
+        print(f"  {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
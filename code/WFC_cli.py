@@ -0,0 +1,168 @@
+import argparse
+import importlib
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import WFC_image
+import WFC_mapfile
+import WFC_ruleset
+
+# Наборы правил: имя -> модуль со своими тайлами, ограничениями и генератором
+RULESETS = {
+    'full': 'WFC_txt',
+    'easy': 'WFC_txt_easy',
+    'overlap': 'WFC_overlap',
+    'voxel': 'WFC_voxel',
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная генерация карт WFC без интерактивного ввода")
+    parser.add_argument('--width', type=int, default=80, help="ширина карты")
+    parser.add_argument('--height', type=int, default=40, help="высота карты")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="зерно первой карты, следующие получают seed+1, seed+2, ...")
+    parser.add_argument('--count', type=int, default=1, help="сколько карт сгенерировать")
+    parser.add_argument('--ruleset', choices=sorted(RULESETS), default='full', help="набор правил")
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python',
+                        help="движок генерации для набора full")
+    parser.add_argument('--output', default='generated_map_{seed}.txt',
+                        help="путь к файлу карты, можно использовать {seed} и {index}")
+    parser.add_argument('--format', choices=['txt', 'bin', 'png'], default='txt',
+                        help="текстовый файл, двоичный формат WFC_mapfile.py или картинка PNG")
+    parser.add_argument('--compression', choices=['none', 'rle', 'zlib'], default='zlib',
+                        help="сжатие данных двоичного формата")
+    parser.add_argument('--scale', type=int, default=1, help="пикселей на клетку для --format png")
+    parser.add_argument('--grid-lines', action='store_true', help="линии сетки для --format png")
+    parser.add_argument('--workers', type=int, default=1, help="число процессов для пакета карт")
+    parser.add_argument('--towns', type=int, default=0,
+                        help="сколько городов соединяет дорожная сеть набора full")
+    parser.add_argument('--samples', nargs='+', default=None,
+                        help="карты-примеры для набора overlap")
+    parser.add_argument('--pattern-size', type=int, default=None,
+                        help="сторона шаблона набора overlap")
+    parser.add_argument('--topology', choices=['square4', 'square8', 'hex'], default='square4',
+                        help="топология сетки набора full (дороги только у square4)")
+    parser.add_argument('--levels', type=int, default=0,
+                        help="число грубых уровней многоуровневой генерации набора full (WFC_multires.py)")
+    parser.add_argument('--depth', type=int, default=None, help="число слоёв набора voxel")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="набор full полосами с доменами в файле (WFC_largemap.py) для карт больше памяти")
+    parser.add_argument('--band-rows', type=int, default=None,
+                        help="высота полосы для --out-of-core")
+    parser.add_argument('--trace', action='store_true',
+                        help="сохранить рядом с картой счётчики решателя и таймлайн (набор full)")
+    parser.add_argument('--log', action='store_true',
+                        help="сохранить рядом с картой журнал коллапсов <файл>.wfcl для WFC_replay.py (набор full)")
+    args = parser.parse_args(argv)
+
+    if args.width <= 0 or args.height <= 0:
+        parser.error("размеры должны быть положительными числами")
+    if args.count <= 0 or args.workers <= 0:
+        parser.error("--count и --workers должны быть положительными")
+    if args.towns < 0:
+        parser.error("--towns не может быть отрицательным")
+    if args.pattern_size is not None and args.pattern_size <= 0:
+        parser.error("--pattern-size должен быть положительным")
+    if args.depth is not None and args.depth <= 0:
+        parser.error("--depth должен быть положительным")
+    if args.scale <= 0:
+        parser.error("--scale должен быть положительным")
+    if args.levels < 0:
+        parser.error("--levels не может быть отрицательным")
+    if args.levels and (args.engine != 'python' or args.topology != 'square4' or args.out_of_core):
+        parser.error("--levels работает только с движком python на сетке square4 и без --out-of-core")
+    if args.band_rows is not None and args.band_rows <= 0:
+        parser.error("--band-rows должен быть положительным")
+    if args.out_of_core and (args.ruleset != 'full' or args.topology != 'square4' or args.trace):
+        parser.error("--out-of-core работает только с набором full на сетке square4 и без --trace")
+    if args.log and (args.ruleset != 'full' or args.engine != 'python' or args.levels or args.out_of_core):
+        parser.error("--log работает только с набором full на движке python без --levels и --out-of-core")
+    if args.out_of_core and args.format == 'png':
+        parser.error("--out-of-core пишет только форматы txt и bin")
+    if args.format == 'bin' and args.seed is not None and (
+            args.seed < 0 or args.seed + args.count - 1 > WFC_mapfile.MAX_SEED):
+        parser.error(f"для --format bin seed карт должен быть от 0 до {WFC_mapfile.MAX_SEED}")
+    if args.count > 1 and '{seed}' not in args.output and '{index}' not in args.output:
+        parser.error("для нескольких карт в --output нужен {seed} или {index}")
+    return args
+
+
+def load_module(ruleset, engine='python', towns=0, samples=None, pattern_size=None, trace=False,
+                topology='square4', depth=None, levels=0, log=False):
+    # Модуль набора правил с настройками; параметры, которых у набора нет, пропускаются
+    module = importlib.import_module(RULESETS[ruleset])
+    if hasattr(module, 'ENGINE'):
+        module.ENGINE = engine
+    if hasattr(module, 'ROAD_TOWNS'):
+        module.ROAD_TOWNS = towns
+    if samples and hasattr(module, 'SAMPLE_FILES'):
+        module.SAMPLE_FILES = samples
+    if pattern_size and hasattr(module, 'PATTERN_SIZE'):
+        module.PATTERN_SIZE = pattern_size
+    if hasattr(module, 'TRACE'):
+        module.TRACE = trace
+    if hasattr(module, 'TOPOLOGY'):
+        module.TOPOLOGY = topology
+    if depth and hasattr(module, 'VOXEL_DEPTH'):
+        module.VOXEL_DEPTH = depth
+    if hasattr(module, 'MULTIRES_LEVELS'):
+        module.MULTIRES_LEVELS = levels
+    if hasattr(module, 'COLLAPSE_LOG'):
+        module.COLLAPSE_LOG = log
+    return module
+
+
+def ruleset_colors(module):
+    # Цвета тайлов для PNG - из набора правил модуля, у overlap его нет, там тайлы набора full
+    ruleset = getattr(module, 'RULESET', None) or WFC_ruleset.load_ruleset('full')
+    return ruleset.colors
+
+
+def generate_one(ruleset, engine, width, height, seed, filename, file_format='txt', compression='zlib',
+                 towns=0, samples=None, pattern_size=None, trace=False, topology='square4', depth=None,
+                 out_of_core=False, band_rows=None, scale=1, grid_lines=False, levels=0, log=False):
+    # Генерирует и сохраняет одну карту. Вызывается и в процессах пула
+    if out_of_core:
+        import WFC_largemap
+        WFC_largemap.generate_to_file(width, height, seed, filename, file_format, compression, towns,
+                                      band_rows or WFC_largemap.BAND_ROWS)
+        return filename
+    module = load_module(ruleset, engine, towns, samples, pattern_size, trace, topology, depth, levels, log)
+    module.generate_map(width, height, seed)
+    if file_format == 'bin':
+        module.save_map_binary(filename, compression)
+    elif file_format == 'png':
+        WFC_image.write_png(filename, module.map_rows(), ruleset_colors(module), scale, grid_lines)
+    else:
+        module.save_map_to_file(filename)
+    if trace and hasattr(module, 'save_trace'):
+        module.save_trace(filename)
+    if log and hasattr(module, 'save_log'):
+        module.save_log(filename)
+    return filename
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    first_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    jobs = [
+        (args.ruleset, args.engine, args.width, args.height, first_seed + index,
+         args.output.format(seed=first_seed + index, index=index), args.format, args.compression,
+         args.towns, args.samples, args.pattern_size, args.trace, args.topology, args.depth,
+         args.out_of_core, args.band_rows, args.scale, args.grid_lines, args.levels, args.log)
+        for index in range(args.count)
+    ]
+    print(f"Генерация {args.count} карт {args.width}x{args.height}, seed {first_seed}...")
+
+    if args.workers == 1:
+        for job in jobs:
+            generate_one(*job)
+    else:
+        with ProcessPoolExecutor(args.workers) as pool:
+            for _ in pool.map(generate_one, *zip(*jobs)):
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,651 @@
+import random
+from array import array
+from collections import Counter, defaultdict, deque
+
+import WFC_roads
+import WFC_rules
+import WFC_sampler
+import WFC_topology
+
+# Откат при противоречии. Для каждого решения (коллапса клетки) в журнале хранятся
+# изменения доменов и счётчиков, откат возвращает их без копирования сетки.
+# В журнале держим BACKTRACK_DEPTH последних решений, за карту допускается не больше
+# BACKTRACK_LIMIT откатов, дальше работаем по-старому (fallback на тайл с наибольшим весом).
+# Откат идёт только по последним решениям, так что на тесных таблицах соседства
+# бюджет может кончиться, и тогда в карте остаются нарушения - их число
+# показывает сводка трассировки (conflict_cells, WFC_trace.py).
+# BACKTRACK_LIMIT = 0 отключает откат
+BACKTRACK_DEPTH = 64
+BACKTRACK_LIMIT = 1000
+
+# Правка готовой карты (edit()): вокруг области заново открывается полоса шириной
+# EDIT_HALO клеток. Если на границе с остальной картой остались противоречия,
+# полоса вокруг них расширяется на клетку и решается снова, не больше EDIT_ROUNDS раз
+EDIT_HALO = 1
+EDIT_ROUNDS = 8
+
+
+def is_collapsed(cell):
+    return cell & (cell - 1) == 0
+
+
+class WFCGenerator:
+    # Одна карта со всем состоянием решателя: домены клеток, счётчики тайлов,
+    # индекс энтропии, журнал отката, дорога и свой генератор случайных чисел.
+    # Набор правил генераторы только читают, поэтому в одном процессе можно
+    # решать сколько угодно карт: по очереди, в пуле потоков или вперемешку по шагам.
+    #
+    #   generator = WFCGenerator(WFC_ruleset.load_ruleset('full'), 80, 40, seed=1)
+    #   (trace=WFC_trace.SolverTrace() включает счётчики и таймлайн, см. WFC_trace.py,
+    #    log=WFC_replay.CollapseLog() - журнал коллапсов для повтора, см. WFC_replay.py)
+    #   while generator.step():   # или просто generator.run()
+    #       ...
+    #   rows = generator.result()
+    #
+    # Сетка задаётся топологией из WFC_topology.py (по умолчанию квадратная с 4 соседями):
+    # клетки хранятся плоским списком cells, номер клетки - topology.index(x, y[, z]).
+    # Внешние методы (place_road, constrain, reopen_cells, load_grid) принимают координаты
+
+    def __init__(self, ruleset, width, height, seed=None, towns=0, roads=None, trace=None, topology=None,
+                 log=None):
+        self.ruleset = ruleset
+        self.topology = topology if topology is not None else WFC_topology.SquareGrid(width, height)
+        self.width = self.topology.width
+        self.height = self.topology.height
+        self.depth = self.topology.depth
+        # При одинаковом seed карта получается одной и той же
+        self.seed = seed if seed is not None else random.randrange(2 ** 63)
+        self.rng = random.Random(self.seed)
+        # Сколько городов соединяет дорожная сеть; roads=False - start() не прокладывает дороги,
+        # None - прокладывает, если в наборе правил есть тайл дороги R.
+        # Дороги и постобработка есть только на квадратной сетке с 4 соседями
+        if roads is None:
+            roads = 'R' in ruleset.tile_bits
+        elif roads and 'R' not in ruleset.tile_bits:
+            raise ValueError(f"в наборе правил {ruleset.name!r} нет тайла дороги R")
+        self.towns = towns
+        self.roads = roads and self.topology.planar
+        self.backtrack_limit = BACKTRACK_LIMIT
+
+        self.tile_bits = ruleset.tile_bits
+        self.bit_tiles = ruleset.bit_tiles
+        self.domain_sizes = ruleset.domain_sizes
+        # Без тайла R маска дороги пустая: get_available_tiles() и collapse_cell() её не замечают
+        self.road_bit = self.tile_bits.get('R', 0)
+        # Тайл для клетки, у которой не осталось вариантов: самый весомый в наборе (первый из равных)
+        self.fallback_bit = self.tile_bits[max(ruleset.tile_types, key=ruleset.weights.get)]
+        # Таблица соседей топологии и правила соседства для каждого её направления
+        self.neighbors = self.topology.neighbors
+        self.degree = self.topology.degree
+        self.allowed = [ruleset.allowed_in(name) for name in self.topology.directions]
+
+        self.total_cells = self.topology.size
+        self.cells = [ruleset.all_tiles_mask] * self.total_cells
+        self.tile_counts = defaultdict(int)
+        # Выбор тайла с весами и процентными ограничениями
+        self.sampler = WFC_sampler.QuotaSampler(self.tile_bits, ruleset.percentage_ranges,
+                                                self.total_cells, ruleset.weights)
+        self.road_cells = set()
+        # Клетки, закреплённые правкой edit(): их не открывают правки соседних областей
+        self.pinned = set()
+        # Ограничения от готовых соседей за краем сетки (constrain()): клетка -> допустимые тайлы.
+        # reopen() сужает по ним заново открытые клетки, conflicts() проверяет их нарушения
+        self.external = {}
+
+        # Журнал отката: последние решения и изменения текущего решения
+        self.decisions = deque(maxlen=BACKTRACK_DEPTH)
+        self.journal = None
+        self.backtracks = 0
+
+        # Клетки, изменившиеся с прошлого take_changes(); None - изменения не отслеживаются
+        self.changed_cells = None
+        # Счётчики и таймлайн решателя (WFC_trace.SolverTrace); None - без трассировки
+        self.trace = trace
+        # Журнал коллапсов (WFC_replay.CollapseLog); None - без журнала. Пишется от создания
+        # генератора до finish(): правки после finish() в журнал не попадают
+        self.log = log
+        if log is not None:
+            log.begin(self)
+        self.started = False
+        self.finished = False
+
+        # Индекс энтропии: клетки разложены по корзинам по размеру домена.
+        # Для каждой клетки помним её позицию в корзине (-1 - клетки в индексе нет),
+        # поэтому удаление - O(1), а случайный выбор из корзины равновероятен,
+        # как и при полном обходе сетки
+        self.entropy_buckets = [[] for _ in range(len(ruleset.tile_types) + 1)]
+        self.bucket_positions = [-1] * self.total_cells
+        self.build_entropy_index()
+
+    @property
+    def grid(self):
+        # Домены строками сетки (у объёмной сетки слои идут друг за другом)
+        width = self.width
+        return [self.cells[i:i + width] for i in range(0, self.total_cells, width)]
+
+    def index_add(self, cell, size):
+        bucket = self.entropy_buckets[size]
+        self.bucket_positions[cell] = len(bucket)
+        bucket.append(cell)
+
+    def index_remove(self, cell, size):
+        bucket = self.entropy_buckets[size]
+        position = self.bucket_positions[cell]
+        self.bucket_positions[cell] = -1
+        last = bucket.pop()
+        if last != cell:
+            bucket[position] = last
+            self.bucket_positions[last] = position
+
+    def build_entropy_index(self):
+        # То же, что index_add() для каждой нерешённой клетки, без вызовов на клетку:
+        # индекс строится заново для всей карты (при создании и в load_grid())
+        buckets = self.entropy_buckets
+        for bucket in buckets:
+            bucket.clear()
+        positions = self.bucket_positions = [-1] * self.total_cells
+        sizes = self.domain_sizes
+        for cell, domain in enumerate(self.cells):
+            if domain & (domain - 1):
+                bucket = buckets[sizes[domain]]
+                positions[cell] = len(bucket)
+                bucket.append(cell)
+
+    def set_domain(self, cell, mask):
+        # Меняет домен клетки и переносит её в нужную корзину индекса
+        old_mask = self.cells[cell]
+        if self.journal is not None:
+            self.journal.append((cell, old_mask))
+        self.cells[cell] = mask
+        if self.changed_cells is not None:
+            self.changed_cells.add(cell)
+        if self.bucket_positions[cell] >= 0:
+            self.index_remove(cell, self.domain_sizes[old_mask])
+        if not is_collapsed(mask):
+            self.index_add(cell, self.domain_sizes[mask])
+
+    def narrow(self, cell, options):
+        # Сужает домен клетки. Клетка, у которой остался один тайл, сразу идёт в счётчики:
+        # иначе процентные ограничения не видели бы тайлы, вынужденные соседями
+        self.set_domain(cell, options)
+        if is_collapsed(options):
+            self.count_tile(self.bit_tiles[options])
+
+    def count_tile(self, tile, delta=1):
+        # Все изменения счётчиков тайлов идут через этот метод, чтобы sampler видел их сразу
+        if self.journal is not None:
+            self.journal.append((None, (tile, delta)))
+        self.tile_counts[tile] += delta
+        self.sampler.update(tile, delta)
+
+    def update_tile_counts(self, new_tile, old_tiles):
+        if is_collapsed(old_tiles):
+            self.count_tile(self.bit_tiles[old_tiles], -1)
+        self.count_tile(new_tile)
+
+    def get_available_tiles(self, cell):
+        # Маска тайлов для выбора; процентные ограничения и веса учитывает sampler.
+        # Дорога допускается только на клетках заранее проложенной дорожной сети
+        options = self.cells[cell]
+        if cell not in self.road_cells and not is_collapsed(options):
+            options &= ~self.road_bit
+        return options
+
+    def apply_post_rules(self, cells=None):
+        # Постобработка готовой карты правилами набора за один проход.
+        # cells - только эти клетки: правила смотрят на окно вокруг них, а не на всю карту.
+        # Правила WFC_rules.py смотрят на 4 соседей, поэтому только для квадратной сетки
+        if not self.topology.planar:
+            return
+        x0 = y0 = 0
+        if cells is None:
+            grid = self.grid
+        else:
+            if not cells:
+                return
+            xs, ys = zip(*map(self.topology.coords, cells))
+            x0, y0 = max(0, min(xs) - 1), max(0, min(ys) - 1)
+            x1, y1 = min(self.width, max(xs) + 2), min(self.height, max(ys) + 2)
+            grid = [self.cells[self.topology.index(x0, y):self.topology.index(x1, y)] for y in range(y0, y1)]
+        for rule, xs, ys in WFC_rules.apply_rules(grid, self.ruleset.post_rules, self.tile_bits):
+            target = self.tile_bits[rule.target]
+            changed = 0
+            for x, y in zip(xs, ys):
+                cell = self.topology.index(x0 + x, y0 + y)
+                if cells is not None and cell not in cells:
+                    continue
+                self.cells[cell] = target
+                changed += 1
+                if self.changed_cells is not None:
+                    self.changed_cells.add(cell)
+            self.count_tile(rule.source, -changed)
+            self.count_tile(rule.target, changed)
+
+    def collapse_cell(self, cell, tile=None):
+        # Возвращает False, если выбрать было не из чего и сработал fallback.
+        # tile - тайл, уже выбранный при повторе по журналу (WFC_replay.py)
+        if is_collapsed(self.cells[cell]):
+            return True
+
+        options = self.get_available_tiles(cell)
+
+        # Убираем дорогу, если она бы образовала перекрёсток
+        if options & self.road_bit and self.too_many_road_neighbors(cell):
+            options &= ~self.road_bit
+
+        found = bool(options)
+        if not found:
+            options = self.fallback_bit
+            if self.trace is not None:
+                self.trace.fallback(self.topology.coords(cell))
+
+        chosen_tile = self.sampler.choose(options, self.rng) if tile is None else tile
+        if self.log is not None:
+            self.log.collapsed(self.bucket_positions[cell], chosen_tile, self.rng)
+        old_tiles = self.cells[cell]
+        self.set_domain(cell, self.tile_bits[chosen_tile])
+        self.update_tile_counts(chosen_tile, old_tiles)
+        return found
+
+    def propagate(self, cell, strict=False):
+        # При strict=True останавливается на первом противоречии (у соседа не осталось
+        # тайлов) и возвращает False, иначе такого соседа просто пропускает.
+        # Сосед в направлении d допускает тайлы allowed[d][домен клетки]
+        cells = self.cells
+        table = self.neighbors
+        directions = list(enumerate(self.allowed))
+        degree = self.degree
+        trace = self.trace
+        if trace is not None:
+            phase = trace.switch('propagate')
+        stack = [cell]
+        while stack:
+            current = stack.pop()
+            domain = cells[current]
+            base = current * degree
+
+            for d, allowed in directions:
+                neighbor = table[base + d]
+                if neighbor < 0:
+                    continue
+                neighbor_options = cells[neighbor]
+
+                valid_neighbor_tiles = neighbor_options & allowed[domain]
+                if not valid_neighbor_tiles and strict:
+                    if trace is not None:
+                        trace.switch(phase)
+                    return False
+
+                if is_collapsed(neighbor_options):
+                    continue
+
+                if valid_neighbor_tiles and valid_neighbor_tiles != neighbor_options:
+                    # То же, что narrow(), без лишнего вызова в самом частом месте
+                    self.set_domain(neighbor, valid_neighbor_tiles)
+                    if is_collapsed(valid_neighbor_tiles):
+                        self.count_tile(self.bit_tiles[valid_neighbor_tiles])
+                    stack.append(neighbor)
+                    if trace is not None:
+                        trace.pushed(len(stack), neighbor_options & ~valid_neighbor_tiles)
+        if trace is not None:
+            trace.switch(phase)
+        return True
+
+    def plan_roads(self):
+        # Дорожная сеть из WFC_roads.py: клетки всех дорог без повторов
+        if not self.topology.planar:
+            raise ValueError("дороги прокладываются только на квадратной сетке с 4 соседями")
+        return WFC_roads.plan_roads(self.width, self.height, self.rng, self.towns)
+
+    def mark_road(self, path):
+        # Клетки path (x, y), на которых разрешена дорога
+        self.road_cells = {self.topology.index(x, y) for x, y in path}
+
+    def place_road(self, path):
+        if not self.road_bit:
+            raise ValueError(f"в наборе правил {self.ruleset.name!r} нет тайла дороги R")
+        self.mark_road(path)
+        cells = [self.topology.index(x, y) for x, y in path]
+        if self.log is not None:
+            self.log.road(cells)
+        for cell in cells:
+            old = self.cells[cell]
+            if is_collapsed(old) and old:
+                self.count_tile(self.bit_tiles[old], -1)
+            self.set_domain(cell, self.road_bit)
+            self.count_tile('R')
+        # Соседи дороги сразу сужаются под неё
+        for cell in cells:
+            self.propagate(cell)
+
+    def too_many_road_neighbors(self, cell):
+        base = cell * self.degree
+        count = 0
+        for neighbor in self.neighbors[base:base + self.degree]:
+            if neighbor >= 0 and self.cells[neighbor] == self.road_bit:
+                count += 1
+        return count >= 2
+
+    def find_lowest_entropy_cell(self):
+        # Первая непустая корзина (начиная с доменов из двух тайлов) - минимальная энтропия
+        for bucket in self.entropy_buckets[2:]:
+            if bucket:
+                return self.rng.choice(bucket)
+        return None
+
+    def undo_decision(self):
+        # Отменяет последнее решение по журналу и возвращает (клетка, выбранный тайл)
+        cell, chosen, changes = self.decisions.pop()
+        if self.trace is not None:
+            phase = self.trace.switch('backtrack')
+            self.trace.backtracked(self.topology.coords(cell))
+        self.journal = None
+        for changed, old in reversed(changes):
+            if changed is None:
+                tile, delta = old
+                self.count_tile(tile, -delta)
+            else:
+                self.set_domain(changed, old)
+        # Запрет выбранного тайла записывается в журнал предыдущего решения
+        self.journal = self.decisions[-1][2] if self.decisions else None
+        if self.trace is not None:
+            self.trace.switch(phase)
+        return cell, chosen
+
+    def collapse_with_backtracking(self, cell, tile=None):
+        self.journal = []
+        ok = self.collapse_cell(cell, tile) and self.propagate(cell, strict=True)
+        self.decisions.append((cell, self.cells[cell], self.journal))
+
+        while not ok and self.decisions and self.backtracks < self.backtrack_limit:
+            self.backtracks += 1
+            cell, chosen = self.undo_decision()
+            remaining = self.cells[cell] & ~chosen
+            # Если запрещать больше нечего, откатываемся ещё на одно решение
+            if remaining:
+                self.narrow(cell, remaining)
+                ok = self.propagate(cell, strict=True)
+
+        if not ok:
+            # Бюджет откатов исчерпан: доводим распространение как раньше
+            self.propagate(cell)
+
+    def start(self):
+        # Прокладывает дорожную сеть. step() вызывает его сам перед первым шагом
+        self.started = True
+        if self.roads:
+            if self.trace is not None:
+                self.trace.switch('roads')
+            self.place_road(self.plan_roads())
+            if self.trace is not None:
+                self.trace.switch(None)
+        if self.log is not None:
+            self.log.started(self)
+
+    def step(self):
+        # Один коллапс клетки с распространением. Возвращает False, когда решать больше нечего
+        if not self.started:
+            self.start()
+        trace = self.trace
+        if trace is not None:
+            trace.switch('entropy')
+        cell = self.find_lowest_entropy_cell()
+        if cell is not None:
+            self.decide(cell)
+            return True
+        if trace is not None:
+            trace.switch(None)
+            trace.flush(self)
+        self.decisions.clear()
+        self.journal = None
+        return False
+
+    def decide(self, cell, tile=None):
+        # Коллапс клетки с распространением и откатом - тело шага step()
+        trace = self.trace
+        if trace is not None:
+            trace.switch('collapse')
+        if self.backtracks < self.backtrack_limit:
+            self.collapse_with_backtracking(cell, tile)
+        else:
+            # Бюджет откатов исчерпан: журнал больше не нужен, иначе он копил бы
+            # изменения всех оставшихся шагов карты
+            self.journal = None
+            self.decisions.clear()
+            self.collapse_cell(cell, tile)
+            self.propagate(cell)
+        if trace is not None:
+            trace.step_done(self)
+
+    def replay_step(self, position, tile):
+        # Шаг по журналу коллапсов (WFC_replay.py): клетка - position-я в корзине
+        # минимальной энтропии, тайл уже выбран, случайные числа не тратятся
+        for bucket in self.entropy_buckets[2:]:
+            if bucket:
+                self.decide(bucket[position], tile)
+                return True
+        return False
+
+    def snapshot(self):
+        # Состояние решателя между шагами, чтобы повтор по журналу мог перематываться
+        # назад без прогона с начала (WFC_replay.py). Порядок клеток в корзинах индекса
+        # тоже сохраняется: по нему журнал находит клетку шага
+        return (array('I', self.cells), dict(self.tile_counts), self.sampler.state(),
+                [array('i', bucket) for bucket in self.entropy_buckets], array('i', self.bucket_positions),
+                [(cell, chosen, list(journal)) for cell, chosen, journal in self.decisions],
+                set(self.road_cells), self.backtracks, self.started, self.finished)
+
+    def restore(self, snapshot):
+        (cells, tile_counts, sampler_state, buckets, positions, decisions, road_cells,
+         self.backtracks, self.started, self.finished) = snapshot
+        self.cells = cells.tolist()
+        self.road_cells = set(road_cells)
+        self.tile_counts = defaultdict(int, tile_counts)
+        self.sampler.restore(sampler_state)
+        self.entropy_buckets = [bucket.tolist() for bucket in buckets]
+        self.bucket_positions = positions.tolist()
+        self.decisions = deque(((cell, chosen, list(journal)) for cell, chosen, journal in decisions),
+                               maxlen=BACKTRACK_DEPTH)
+        self.journal = self.decisions[-1][2] if self.decisions else None
+        if self.changed_cells is not None:
+            self.changed_cells.update(range(self.total_cells))
+
+    def finish(self):
+        # Постобработка решённой карты, выполняется один раз
+        if not self.finished:
+            self.finished = True
+            if self.trace is not None:
+                self.trace.switch('post')
+            self.apply_post_rules()
+            if self.trace is not None:
+                self.trace.switch(None)
+            if self.log is not None:
+                self.log.finished(self)
+                self.log = None
+
+    def run(self):
+        # Решает карту до конца вместе с постобработкой
+        while self.step():
+            pass
+        self.finish()
+        return self
+
+    def result(self):
+        # Готовая карта строками тайлов, при необходимости карта сначала дорешивается
+        if not self.finished:
+            self.run()
+        return self.map_rows()
+
+    def map_rows(self):
+        # Текущее состояние сетки строками тайлов, '?' - клетка без вариантов.
+        # У объёмной сетки строки слоёв идут подряд, снизу вверх
+        bit_tiles = self.bit_tiles
+        return [''.join(bit_tiles[cell & -cell] if cell else '?' for cell in row) for row in self.grid]
+
+    def track_changes(self):
+        # Включает отслеживание изменений; первый take_changes() вернёт всю сетку
+        self.changed_cells = set(range(self.total_cells))
+
+    def take_changes(self):
+        # Изменения (x, y[, z], домен) с прошлого вызова одной пачкой
+        coords = self.topology.coords
+        batch = [(*coords(cell), self.cells[cell]) for cell in self.changed_cells]
+        self.changed_cells.clear()
+        return batch
+
+    def load_grid(self, grid):
+        # Подставляет готовую сетку строками (из другого движка или собранную из блоков):
+        # индекс энтропии и счётчики тайлов пересчитываются по ней
+        self.cells = [cell for row in grid for cell in row]
+        self.build_entropy_index()
+        bit_tiles = self.bit_tiles
+        for cell, count in Counter(self.cells).items():
+            if is_collapsed(cell) and cell:
+                self.count_tile(bit_tiles[cell], count)
+
+    def constrain(self, x, y, neighbor_tile, direction):
+        # Сужает клетку под готовый тайл соседа за пределами сетки (край соседнего чанка);
+        # direction - с какой стороны от клетки стоит этот сосед ('left', 'up', ...)
+        toward_cell = self.topology.opposite[self.topology.direction(direction)]
+        self.restrict(self.topology.index(x, y), self.allowed[toward_cell][self.tile_bits[neighbor_tile]])
+
+    def constrain_through(self, x, y, tile, first, second):
+        # Сужает клетку под готовый тайл за краем, до которого два шага: first от клетки
+        # к ещё не решённой клетке за краем, second - от неё к тайлу. Клетка за краем
+        # должна потом подойти и к этой клетке, и к тайлу (угол чанка у диагонального соседа)
+        topology = self.topology
+        toward_between = topology.opposite[topology.direction(second)]
+        between = self.allowed[toward_between][self.tile_bits[tile]]
+        toward_cell = topology.opposite[topology.direction(first)]
+        self.restrict(topology.index(x, y), self.allowed[toward_cell][between])
+
+    def restrict(self, cell, allowed):
+        # Запоминает ограничение от соседей за краем и сужает по нему клетку.
+        # Противоречие с уже решёнными клетками сетки находит conflicts() и разрешает resolve().
+        # Если ни один тайл не подходит ко всем соседям за краем сразу, ограничение
+        # остаётся прежним: клетка согласуется с первыми соседями, а не остаётся без тайла
+        current = self.external.get(cell, self.ruleset.all_tiles_mask)
+        self.external[cell] = current & allowed or current
+        options = self.cells[cell] & self.external[cell]
+        if options and options != self.cells[cell]:
+            self.narrow(cell, options)
+            self.propagate(cell)
+
+    def reopen_cells(self, coords):
+        # Возвращает клетки (x, y) в неопределённое состояние и сразу сужает их
+        # по готовым соседям, которые остаются как есть
+        self.reopen([self.topology.index(x, y) for x, y in set(coords)])
+
+    def reopen(self, order):
+        # То же для номеров клеток, в порядке order
+        cells = set(order)
+        all_tiles = self.ruleset.all_tiles_mask
+        for cell in order:
+            if is_collapsed(self.cells[cell]) and self.cells[cell]:
+                self.count_tile(self.bit_tiles[self.cells[cell]], -1)
+            self.set_domain(cell, all_tiles)
+
+        opposite = self.topology.opposite
+        for cell in order:
+            options = self.external.get(cell, all_tiles)
+            base = cell * self.degree
+            for d in range(self.degree):
+                neighbor = self.neighbors[base + d]
+                if neighbor >= 0 and neighbor not in cells:
+                    # Клетка стоит от соседа в противоположном направлении
+                    narrowed = options & self.allowed[opposite[d]][self.cells[neighbor]]
+                    if narrowed:
+                        options = narrowed
+            if options != self.cells[cell]:
+                self.narrow(cell, options)
+                self.propagate(cell)
+
+    def halo(self, cells, width):
+        # Клетки не дальше width шагов по соседям от cells, без самих cells
+        table, degree = self.neighbors, self.degree
+        seen = set(cells)
+        frontier = seen
+        for _ in range(width):
+            frontier = {neighbor for cell in frontier for neighbor in table[cell * degree:(cell + 1) * degree]
+                        if neighbor >= 0 and neighbor not in seen}
+            seen |= frontier
+        return seen - set(cells)
+
+    def conflicts(self, cells):
+        # Клетки из cells без тайла или с нарушенным соседством (вместе с такими соседями),
+        # в том числе с соседями за краем сетки из constrain().
+        # Тайлы только для постобработки (песок) в таблицах соседства нет, их не проверяем
+        table, degree = self.neighbors, self.degree
+        generated = self.ruleset.all_tiles_mask
+        external = self.external
+        found = set()
+        for cell in cells:
+            domain = self.cells[cell]
+            if not domain or cell in external and not domain & external[cell]:
+                found.add(cell)
+                continue
+            if domain & ~generated:
+                continue
+            for d in range(degree):
+                neighbor = table[cell * degree + d]
+                if neighbor < 0:
+                    continue
+                other = self.cells[neighbor]
+                if other and not other & ~generated and not other & self.allowed[d][domain]:
+                    found.update((cell, neighbor))
+        return found
+
+    def rectangle(self, x0, y0, x1, y1):
+        # Клетки прямоугольника между углами (x0, y0) и (x1, y1) включительно, обрезанного краями карты
+        xs = range(max(0, min(x0, x1)), min(self.width, max(x0, x1) + 1))
+        ys = range(max(0, min(y0, y1)), min(self.height, max(y0, y1) + 1))
+        return [(x, y) for y in ys for x in xs]
+
+    def brush(self, x, y, radius):
+        # Клетки круглой кисти радиуса radius с центром (x, y)
+        return [(cx, cy) for cx, cy in self.rectangle(x - radius, y - radius, x + radius, y + radius)
+                if (cx - x) ** 2 + (cy - y) ** 2 <= radius * radius]
+
+    def edit(self, coords, tile=None, halo=EDIT_HALO):
+        # Правка готовой карты: tile - закрепить этот тайл в клетках coords, None - стереть их.
+        # Заново решаются только стёртые клетки и полоса вокруг области, остальная карта
+        # заморожена, поэтому цена правки зависит от её размера, а не от размера карты.
+        # Возвращает номера перерешённых клеток
+        region = {self.topology.index(*xy) for xy in coords}
+        if tile is not None:
+            bit = self.tile_bits[tile]
+            for cell in region:
+                old = self.cells[cell]
+                if is_collapsed(old) and old:
+                    self.count_tile(self.bit_tiles[old], -1)
+                self.set_domain(cell, bit)
+                self.count_tile(tile)
+            self.pinned |= region
+            opened = set()
+        else:
+            self.pinned -= region
+            opened = set(region)
+        opened |= self.halo(region, halo)
+        opened -= self.pinned
+        return self.resolve(opened)
+
+    def resolve(self, cells):
+        # Открывает клетки cells и решает их заново при замороженной остальной карте.
+        # Противоречия на границе расширяют открытую область, см. EDIT_ROUNDS
+        cells = set(cells)
+        self.reopen(sorted(cells))
+        for _ in range(EDIT_ROUNDS):
+            while self.step():
+                pass
+            conflicts = self.conflicts(cells)
+            grown = (conflicts | self.halo(conflicts, 1)) - self.pinned
+            if not grown:
+                break
+            cells |= grown
+            self.reopen(sorted(grown))
+        # Клетки, открытые в последнем раунде, тоже должны получить тайлы
+        while self.step():
+            pass
+        if self.finished:
+            self.apply_post_rules(cells)
+        return cells
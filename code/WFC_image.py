@@ -0,0 +1,72 @@
+import struct
+import zlib
+
+# Экспорт карты в PNG без pygame и без окна. Пишется PNG с палитрой
+# (8 бит на пиксель, индекс цвета): строки тайлов переводятся в индексы палитры
+# одной таблицей bytes.translate, увеличение и линии сетки - присваивания срезов,
+# так что на клетку не приходится ни одного вызова Python.
+#
+#   WFC_image.write_png('map.png', rows, RULESET.colors, scale=4, grid_lines=True)
+
+# Цвет тайлов, которых нет в палитре, и клеток без вариантов ('?')
+UNKNOWN_COLOR = (180, 180, 180)
+GRID_COLOR = (50, 50, 50)
+# Уровень сжатия zlib. Карта WFC мелко перемешана и сжимается плохо: уровень 6
+# даёт файл на 15% меньше, но в 5-8 раз медленнее, для превью это не окупается
+COMPRESSION_LEVEL = 1
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def scale_row(row, scale, line):
+    # Строка индексов, растянутая в scale раз; line - индекс цвета сетки
+    # для последнего пикселя каждой клетки или None
+    scaled = bytearray(len(row) * scale)
+    for offset in range(scale):
+        scaled[offset::scale] = row
+    if line is not None:
+        scaled[scale - 1::scale] = bytes((line,)) * len(row)
+    return bytes(scaled)
+
+
+def encode_png(rows, colors, scale=1, grid_lines=False):
+    # PNG карты в памяти. rows - строки тайлов, colors - тайл -> (r, g, b).
+    # Линии сетки рисуются по правому и нижнему краю клеток, только при scale >= 2
+    palette = list(colors.values()) + [UNKNOWN_COLOR]
+    table = bytearray([len(colors)]) * 256
+    for index, tile in enumerate(colors):
+        table[ord(tile)] = index
+    line = None
+    if grid_lines and scale >= 2:
+        line = len(palette)
+        palette.append(GRID_COLOR)
+
+    width, height = len(rows[0]) * scale, len(rows) * scale
+    lines = []
+    for row in rows:
+        indices = row.encode('ascii').translate(table)
+        if scale == 1:
+            lines.append(b'\0' + indices)
+            continue
+        scanline = b'\0' + scale_row(indices, scale, line)
+        lines.extend([scanline] * (scale if line is None else scale - 1))
+        if line is not None:
+            lines.append(b'\0' + bytes((line,)) * width)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)
+    return b''.join((
+        PNG_SIGNATURE,
+        png_chunk(b'IHDR', header),
+        png_chunk(b'PLTE', b''.join(bytes(color) for color in palette)),
+        png_chunk(b'IDAT', zlib.compress(b''.join(lines), COMPRESSION_LEVEL)),
+        png_chunk(b'IEND', b''),
+    ))
+
+
+def write_png(filename, rows, colors, scale=1, grid_lines=False):
+    with open(filename, 'wb') as f:
+        f.write(encode_png(rows, colors, scale, grid_lines))
@@ -0,0 +1,134 @@
+import mmap
+import random
+import tempfile
+from array import array
+from collections import defaultdict
+
+import WFC_generator
+import WFC_mapfile
+import WFC_roads
+import WFC_rules
+import WFC_txt
+
+# Генерация карт больше оперативной памяти (набор full). Домены клеток лежат
+# в файле, отображённом в память (MappedGrid), по маске фиксированной ширины на клетку.
+# Решатель идёт по карте полосами по BAND_ROWS строк: каждая полоса - отдельный
+# WFCGenerator, первая строка полосы сужается по последней строке предыдущей,
+# как края соседних чанков в WFC_txt.generate_chunk(). Готовые строки сразу
+# проходят постобработку и пишутся в файл карты, поэтому пиковая память зависит
+# от ширины карты и высоты полосы, а не от размера карты.
+#
+#   python WFC_cli.py --out-of-core --width 10000 --height 10000 --format bin
+
+# Высота полосы, которую решает один генератор
+BAND_ROWS = 32
+
+
+class MappedGrid:
+    # Домены клеток width x height в файле через mmap: 1, 2 или 4 байта на клетку
+    # в зависимости от числа тайлов. filename=None - временный файл, удаляется при close()
+
+    def __init__(self, width, height, tile_count, filename=None):
+        self.width = width
+        self.height = height
+        self.typecode = 'B' if tile_count <= 8 else 'H' if tile_count <= 16 else 'I'
+        self.cell_bytes = array(self.typecode).itemsize
+        size = width * height * self.cell_bytes
+        self.file = tempfile.TemporaryFile() if filename is None else open(filename, 'w+b')
+        self.file.truncate(size)
+        self.data = mmap.mmap(self.file.fileno(), size)
+
+    def read_rows(self, y0, y1):
+        # Строки y0..y1-1 списками масок
+        cells = array(self.typecode)
+        cells.frombytes(self.data[y0 * self.width * self.cell_bytes:y1 * self.width * self.cell_bytes])
+        return [cells[i:i + self.width].tolist() for i in range(0, len(cells), self.width)]
+
+    def write_rows(self, y0, rows):
+        data = array(self.typecode, [cell for row in rows for cell in row]).tobytes()
+        start = y0 * self.width * self.cell_bytes
+        self.data[start:start + len(data)] = data
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class TextWriter:
+    # Текстовый файл карты, строки дописываются по мере готовности
+
+    def __init__(self, filename):
+        self.file = open(filename, 'w')
+
+    def write_rows(self, rows):
+        self.file.write(''.join(row + '\n' for row in rows))
+
+    def close(self):
+        self.file.close()
+
+
+def solve_band(grid, y0, height, seed, road_cells, next_road=()):
+    # Решает строки y0..y0+height-1 и записывает их домены в grid. next_road - x клеток
+    # дороги в первой строке следующей полосы: последняя строка полосы сразу сужается
+    # под дорогу снизу, иначе у края полосы рядом с дорогой встают несовместимые с ней тайлы
+    band = WFC_generator.WFCGenerator(WFC_txt.RULESET, grid.width, height, f"{seed}:{y0}", roads=False)
+    if road_cells:
+        band.place_road(road_cells)
+    for x in next_road:
+        band.constrain(x, height - 1, 'R', 'down')
+    if y0 > 0:
+        bit_tiles = band.bit_tiles
+        for x, cell in enumerate(grid.read_rows(y0 - 1, y0)[0]):
+            if cell:
+                band.constrain(x, 0, bit_tiles[cell], 'up')
+    while band.step():
+        pass
+    grid.write_rows(y0, band.grid)
+
+
+def finish_rows(grid, y0, y1):
+    # Строки тайлов y0..y1-1 после постобработки. Правила смотрят на соседей,
+    # поэтому читается окно на строку шире с каждой стороны
+    top, bottom = max(0, y0 - 1), min(grid.height, y1 + 1)
+    window = grid.read_rows(top, bottom)
+    WFC_rules.apply_rules(window, WFC_txt.RULESET.post_rules, WFC_txt.RULESET.tile_bits)
+    bit_tiles = WFC_txt.RULESET.bit_tiles
+    return [''.join(bit_tiles[cell & -cell] if cell else '?' for cell in row)
+            for row in window[y0 - top:y1 - top]]
+
+
+def generate_to_file(width, height, seed=None, filename="generated_map.txt", file_format='txt',
+                     compression='zlib', towns=0, band_rows=BAND_ROWS, storage=None):
+    # Генерирует карту полосами и пишет её в filename по мере готовности строк.
+    # storage - путь к файлу доменов (по умолчанию временный файл)
+    if seed is None:
+        seed = random.randrange(2 ** 63)
+    road = WFC_roads.plan_roads(width, height, random.Random(seed), towns)
+    road_rows = defaultdict(list)
+    for x, y in road:
+        road_rows[y].append(x)
+
+    grid = MappedGrid(width, height, len(WFC_txt.RULESET.tile_bits), storage)
+    if file_format == 'bin':
+        rules_hash = WFC_mapfile.ruleset_hash(WFC_txt.tile_types, WFC_txt.tile_adjacency,
+                                              WFC_txt.TILE_PERCENTAGE_RANGES)
+        writer = WFC_mapfile.MapWriter(filename, width, height, WFC_txt.tile_types + ['S', '?'],
+                                       seed, rules_hash, compression)
+    else:
+        writer = TextWriter(filename)
+
+    try:
+        # Строка готова, когда решена и следующая: постобработка смотрит на неё
+        written = 0
+        for y0 in range(0, height, band_rows):
+            band_height = min(band_rows, height - y0)
+            road_cells = [(x, y - y0) for y in range(y0, y0 + band_height) for x in road_rows[y]]
+            solve_band(grid, y0, band_height, seed, road_cells, road_rows[y0 + band_height])
+            ready = y0 + band_height - 1 if y0 + band_height < height else height
+            writer.write_rows(finish_rows(grid, written, ready))
+            written = ready
+    finally:
+        writer.close()
+        grid.close()
+    print(f"Карта успешно сохранена в файл {filename}")
+    return seed
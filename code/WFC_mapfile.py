@@ -0,0 +1,200 @@
+import hashlib
+import json
+import mmap
+import struct
+import zlib
+from itertools import groupby
+
+# Двоичный формат карты:
+#   заголовок  - сигнатура, версия, сжатие, ширина, высота, seed, хеш правил,
+#                размер палитры и сама палитра (по байту на тайл)
+#   данные     - по байту на клетку (индекс в палитре), строка за строкой,
+#                без сжатия, в RLE (пары "длина, значение") или через zlib
+MAGIC = b'WFCM'
+VERSION = 1
+HEADER = struct.Struct('<4sBBIIQ8sB')
+
+COMPRESSION = {'none': 0, 'rle': 1, 'zlib': 2}
+# Seed хранится без знака; карта без seed помечается всеми единицами
+# (в файлах, записанных со знаковым полем, это был -1 - те же байты)
+NO_SEED = 2 ** 64 - 1
+MAX_SEED = NO_SEED - 1
+
+
+def ruleset_hash(tile_types, tile_adjacency, percentage_ranges):
+    # Короткий хеш набора правил, чтобы по файлу понять, какими правилами он получен
+    rules = {
+        'tiles': list(tile_types),
+        'adjacency': {tile: sorted(allowed) for tile, allowed in tile_adjacency.items()},
+        'ranges': {tile: list(bounds) for tile, bounds in percentage_ranges.items()},
+    }
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).digest()[:8]
+
+
+def pack_seed(seed):
+    if seed is None:
+        return NO_SEED
+    if not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"seed {seed} не помещается в файл карты: допустимо от 0 до {MAX_SEED}")
+    return seed
+
+
+def palette_table(palette):
+    # Таблица перевода символов тайлов в индексы палитры
+    table = bytearray(range(256))
+    for index, tile in enumerate(palette):
+        table[tile] = index
+    return table
+
+
+def check_tiles(text, palette):
+    # Тайлы, которых нет в палитре, записались бы как есть - кодом символа вместо индекса
+    missing = text.translate(None, palette)
+    if missing:
+        raise ValueError(f"тайлов {''.join(sorted(set(missing.decode('ascii'))))!r} нет в палитре "
+                         f"{palette.decode('ascii')!r}")
+
+
+def encode_rle(data):
+    out = bytearray()
+    for value, run in groupby(data):
+        length = sum(1 for _ in run)
+        while length > 0:
+            out += bytes((min(length, 255), value))
+            length -= 255
+    return bytes(out)
+
+
+def decode_rle(data):
+    return b''.join(bytes((data[i + 1],)) * data[i] for i in range(0, len(data), 2))
+
+
+def encode_map(rows, palette=None, seed=None, rules_hash=b'', compression='none'):
+    # Файл карты в памяти. rows - строки тайлов одинаковой длины, palette - символы тайлов
+    text = ''.join(rows).encode('ascii')
+    if palette is None:
+        palette = sorted(set(text.decode('ascii')))
+    palette = ''.join(palette).encode('ascii')
+    check_tiles(text, palette)
+
+    # Перевод символов в индексы палитры одной таблицей
+    data = text.translate(palette_table(palette))
+
+    if compression == 'rle':
+        data = encode_rle(data)
+    elif compression == 'zlib':
+        data = zlib.compress(data)
+
+    header = HEADER.pack(MAGIC, VERSION, COMPRESSION[compression], len(rows[0]), len(rows),
+                         pack_seed(seed), rules_hash.ljust(8, b'\0')[:8], len(palette))
+    return header + palette + data
+
+
+def write_map(filename, rows, palette=None, seed=None, rules_hash=b'', compression='none'):
+    with open(filename, 'wb') as f:
+        f.write(encode_map(rows, palette, seed, rules_hash, compression))
+
+
+class MapWriter:
+    # Запись карты по частям: заголовок пишется сразу, строки - по мере готовности,
+    # так что всю карту держать в памяти не нужно. RLE кодирует каждую пачку строк
+    # отдельно: формат тот же, просто серии не переходят через границу пачки
+
+    def __init__(self, filename, width, height, palette, seed=None, rules_hash=b'', compression='none'):
+        self.palette = ''.join(palette).encode('ascii')
+        self.table = palette_table(self.palette)
+        seed = pack_seed(seed)
+        self.compression = compression
+        self.compressor = zlib.compressobj() if compression == 'zlib' else None
+
+        self.file = open(filename, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, COMPRESSION[compression], width, height,
+                                    seed, rules_hash.ljust(8, b'\0')[:8], len(self.palette)))
+        self.file.write(self.palette)
+
+    def write_rows(self, rows):
+        data = ''.join(rows).encode('ascii')
+        check_tiles(data, self.palette)
+        data = data.translate(self.table)
+        if self.compression == 'rle':
+            data = encode_rle(data)
+        elif self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.file.write(data)
+
+    def close(self):
+        if self.compressor is not None:
+            self.file.write(self.compressor.flush())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MapFile:
+    # Карта в двоичном формате. Несжатые файлы читаются через mmap, так что
+    # область карты можно прочитать, не загружая в память весь файл
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, compression, width, height, seed, rules_hash, palette_size = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename}: не файл карты WFC или неизвестная версия")
+
+        self.width = width
+        self.height = height
+        self.seed = None if seed == NO_SEED else seed
+        self.ruleset_hash = rules_hash
+        self.compression = {code: name for name, code in COMPRESSION.items()}[compression]
+
+        start = HEADER.size
+        self.palette = self.data[start:start + palette_size].decode('ascii')
+        self.offset = start + palette_size
+
+        # Обратная таблица: индекс палитры -> символ тайла
+        self.table = bytearray(range(256))
+        for index, tile in enumerate(self.palette.encode('ascii')):
+            self.table[index] = tile
+
+        # Сжатые данные всё равно приходится распаковать целиком
+        self.cells = self.data
+        if self.compression == 'rle':
+            self.cells, self.offset = decode_rle(self.data[self.offset:]), 0
+        elif self.compression == 'zlib':
+            self.cells, self.offset = zlib.decompress(self.data[self.offset:]), 0
+
+    def read_region(self, x, y, width, height):
+        # Строки тайлов прямоугольника (x, y, width, height); он должен лежать внутри карты
+        if x < 0 or y < 0 or width < 0 or height < 0 or x + width > self.width or y + height > self.height:
+            raise ValueError(f"область ({x}, {y}, {width}, {height}) выходит за карту "
+                             f"{self.width}x{self.height}")
+        rows = []
+        for row in range(y, y + height):
+            start = self.offset + row * self.width + x
+            rows.append(self.cells[start:start + width].translate(self.table).decode('ascii'))
+        return rows
+
+    def read_rows(self):
+        return self.read_region(0, 0, self.width, self.height)
+
+    def close(self):
+        self.cells = None
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_map(filename):
+    with MapFile(filename) as map_file:
+        return map_file.read_rows()
@@ -0,0 +1,113 @@
+import random
+
+import WFC_generator
+import WFC_roads
+
+# Многоуровневая генерация: сначала решается грубая сетка (в LEVEL_FACTOR ** levels
+# раз мельче карты) - раскладка крупных пятен тайлов, затем каждый следующий уровень
+# в LEVEL_FACTOR раз крупнее решается только среди тайлов, которые есть в окрестности
+# его клетки-родителя. Домены тонких уровней с самого начала маленькие, поэтому
+# распространение короткое, а процентные ограничения держатся на всех масштабах сразу:
+# грубый уровень задаёт доли тайлов, тонкие их почти не меняют.
+# Дорожная сеть прокладывается один раз по размеру карты. На грубых уровнях клетки,
+# через которые она проходит, решаются только среди соседей дороги (трава, земля):
+# земля (D) соседствует лишь с травой и дорогой, и без этого её пятна на грубых
+# уровнях почти не появляются. Саму дорогу в грубую клетку не ставим: вокруг неё
+# получилась бы полоса земли и травы шириной в несколько клеток карты.
+#
+#   generator = WFC_multires.generate(ruleset, 1000, 1000, seed=1, levels=3)
+
+# Во сколько раз каждый уровень мельче следующего
+LEVEL_FACTOR = 2
+# Полуширина полосы вокруг дороги, где ограничения грубого уровня снимаются
+ROAD_MARGIN = 2
+
+
+def upsample(generator, width, height, factor=LEVEL_FACTOR):
+    # Домены клеток уровня width x height из решённого уровня generator: тайлы четырёх
+    # родителей вокруг ближайшего к клетке угла её родителя. Внутри пятна клетки
+    # повторяют родителя, на границе пятен выбирают из тайлов обоих.
+    # Тайлы только для постобработки в грубых уровнях не появляются: там нет finish()
+    parents = [[cell or generator.ruleset.all_tiles_mask for cell in row] for row in generator.grid]
+    last_x, last_y = generator.width - 1, generator.height - 1
+    half = factor / 2
+    rows = []
+    for y in range(height):
+        py = y // factor
+        row, side_row = parents[py], parents[max(0, py - 1) if y % factor < half else min(last_y, py + 1)]
+        domains = []
+        for x in range(width):
+            px = x // factor
+            sx = max(0, px - 1) if x % factor < half else min(last_x, px + 1)
+            domains.append(row[px] | row[sx] | side_row[px] | side_row[sx])
+        rows.append(domains)
+    return rows
+
+
+def level_sizes(width, height, levels, factor=LEVEL_FACTOR):
+    # Размеры уровней от самого грубого до карты
+    sizes = []
+    for level in range(levels, -1, -1):
+        scale = factor ** level
+        sizes.append((-(-width // scale), -(-height // scale)))
+    return sizes
+
+
+def coarse_road(road, scale):
+    # Дорога на уровне в scale раз мельче карты: клетки уровня, через которые она
+    # проходит, без повторов и в порядке пути
+    return list(dict.fromkeys((x // scale, y // scale) for x, y in road))
+
+
+def mark_road_area(generator, road):
+    # Сужает клетки road грубого уровня до тайлов, которые могут стоять рядом с дорогой
+    ruleset = generator.ruleset
+    near_road = 0
+    for tile in ruleset.adjacency['R']:
+        if tile != 'R':
+            near_road |= ruleset.tile_bits[tile]
+    for x, y in road:
+        cell = generator.topology.index(x, y)
+        options = generator.cells[cell] & near_road
+        if options and options != generator.cells[cell]:
+            generator.narrow(cell, options)
+            generator.propagate(cell)
+
+
+def generate(ruleset, width, height, seed=None, levels=3, towns=0, roads=None, trace=None):
+    # Решает карту через levels грубых уровней и возвращает генератор последнего,
+    # уже с постобработкой. trace - только для последнего уровня; roads - как у WFCGenerator
+    if roads is None:
+        roads = 'R' in ruleset.tile_bits
+    seed = seed if seed is not None else random.randrange(2 ** 63)
+    rng = random.Random(seed)
+    domains = None
+    sizes = level_sizes(width, height, levels)
+    road = WFC_roads.plan_roads(width, height, random.Random(seed), towns) if roads else []
+    for level, (level_width, level_height) in enumerate(sizes):
+        last = level == len(sizes) - 1
+        generator = WFC_generator.WFCGenerator(ruleset, level_width, level_height,
+                                               seed if last else rng.getrandbits(64), towns,
+                                               roads=False, trace=trace if last else None)
+        level_road = coarse_road(road, LEVEL_FACTOR ** (len(sizes) - 1 - level))
+        if domains is not None:
+            # Дорога проходит через любые пятна: в полосе ROAD_MARGIN клеток вокруг неё
+            # допускаются все тайлы, чтобы между дорогой и пятном нашёлся переход
+            for x, y in level_road:
+                for ny in range(max(0, y - ROAD_MARGIN), min(level_height, y + ROAD_MARGIN + 1)):
+                    for nx in range(max(0, x - ROAD_MARGIN), min(level_width, x + ROAD_MARGIN + 1)):
+                        domains[ny][nx] = ruleset.all_tiles_mask
+            generator.load_grid(domains)
+            # Клетки, где от родителя остался один тайл, уже решены: сужаем их соседей
+            for cell, domain in enumerate(generator.cells):
+                if domain and WFC_generator.is_collapsed(domain):
+                    generator.propagate(cell)
+        if level_road and last:
+            generator.place_road(level_road)
+        elif level_road:
+            mark_road_area(generator, level_road)
+        if last:
+            return generator.run()
+        while generator.step():
+            pass
+        domains = upsample(generator, *sizes[level + 1])
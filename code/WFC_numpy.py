@@ -0,0 +1,243 @@
+import numpy as np
+
+import WFC_sampler
+import WFC_topology
+
+# Векторный движок WFC. Домены клеток - те же битовые маски, что у WFCGenerator,
+# одним массивом domains. Распространение идёт волнами: соседи всех клеток, изменившихся
+# на прошлой волне, разом сужаются по таблицам Ruleset.allowed_in() со всех четырёх
+# сторон, изменившиеся идут в следующую волну.
+#
+#   engine = NumpyEngine(WFC_ruleset.load_ruleset('full'), 200, 200, seed=1)
+#   engine.place_road(path)
+#   engine.run()
+#   grid = engine.to_grid()     # сетка битовых масок для WFCGenerator.load_grid()
+#
+# Скорость только решателя (после дороги, без постобработки) против WFCGenerator.step()
+# на наборе full, процессорное время: 300x300 - около 330 тыс. клеток/с против 80 тыс.,
+# 1000x1000 - около 260 тыс. против 80 тыс., то есть в 3-4 раза, а не на порядок.
+# На пачку приходится около трёх волн, и каждая волна - несколько выборок numpy по
+# индексам клеток, а find_lowest_entropy_cells() на каждой пачке сравнивает приоритеты
+# всей карты со сдвигами NEAR_OFFSETS: на карте 1000x1000 это примерно треть времени
+
+# За один шаг коллапсируем эту долю клеток: пачка набирается по возрастанию
+# энтропии и достаточно мала, чтобы процентные ограничения не "уплывали"
+BATCH_FRACTION = 0.02
+# Клетки одной пачки стоят дальше SPACING шагов друг от друга
+SPACING = 2
+NEAR_OFFSETS = [(dx, dy) for dy in range(-SPACING, SPACING + 1) for dx in range(-SPACING, SPACING + 1)
+                if 0 < abs(dx) + abs(dy) <= SPACING]
+
+
+class NumpyEngine:
+    # Одна карта со всем состоянием движка, как WFCGenerator (WFC_generator.py):
+    # домены, счётчики тайлов, дорога и свой генератор случайных чисел.
+    # Набор правил движки только читают, так что карт в одном процессе может быть сколько угодно
+
+    def __init__(self, ruleset, width, height, seed=None):
+        self.width, self.height = width, height
+        self.total_cells = width * height
+        self.tile_types = list(ruleset.tile_types)
+        t = len(self.tile_types)
+        index = {tile: i for i, tile in enumerate(self.tile_types)}
+        self.road = index.get('R', -1)
+        self.road_bit = ruleset.tile_bits.get('R', 0)
+        # Тайл для клетки без вариантов - как fallback_bit у WFCGenerator
+        self.fallback = index[max(self.tile_types, key=ruleset.weights.get)]
+        self.bits = np.left_shift(1, np.arange(t))
+
+        # neighbors[cell, d] - сосед в направлении d из таблицы WFC_topology.SquareGrid или
+        # лишняя клетка sink за краем карты. Домен sink - маска за пределами таблиц правил,
+        # для неё в конце каждой таблицы стоят все тайлы: со стороны края клетку никто не сужает
+        topology = WFC_topology.SquareGrid(width, height)
+        self.sink = self.total_cells
+        self.neighbors = np.frombuffer(topology.neighbors, dtype=np.int32).astype(np.intp)
+        self.neighbors = self.neighbors.reshape(self.total_cells, topology.degree)
+        self.neighbors[self.neighbors < 0] = self.sink
+        # pull[d][домен соседа в направлении d] - тайлы, которые этот сосед допускает в клетке
+        self.pull = np.array([ruleset.allowed_in(topology.directions[topology.opposite[d]])
+                              + [ruleset.all_tiles_mask] for d in range(topology.degree)], dtype=np.int32)
+        self.direction_index = np.arange(topology.degree)
+        self.sizes = np.array(ruleset.domain_sizes + [t], dtype=np.int16)
+        # Номер тайла по маске из одного бита
+        self.tile_index = np.zeros(len(self.sizes), dtype=np.intp)
+        self.tile_index[self.bits] = np.arange(t)
+        self.last_seen = np.zeros(self.total_cells + 1, dtype=np.intp)
+        # Буферы find_lowest_entropy_cells(): приоритеты с рамкой SPACING из бесконечностей
+        # и результат одного сравнения, чтобы не заводить массивы размером с карту на каждую пачку
+        self.priority = np.full((height + 2 * SPACING, width + 2 * SPACING), np.inf)
+        self.nearer = np.empty((height, width), dtype=bool)
+
+        self.domains = np.full(self.total_cells + 1, ruleset.all_tiles_mask, dtype=np.int32)
+        self.domains[self.sink] = len(self.sizes) - 1
+        self.domain_count = np.full((height, width), t, dtype=np.int16)
+        self.road_cells = np.zeros((height, width), dtype=bool)
+
+        ranges = ruleset.percentage_ranges
+        self.tile_counts = np.zeros(t, dtype=np.int64)
+        self.min_counts = np.array([ranges[tile][0] * self.total_cells / 100 if tile in ranges else 0
+                                    for tile in self.tile_types])
+        self.max_counts = np.array([ranges[tile][1] * self.total_cells / 100 if tile in ranges else np.inf
+                                    for tile in self.tile_types])
+        self.weights = np.array([ruleset.weights.get(tile, 1.0) for tile in self.tile_types])
+        self.batch_limit = max(1, int(self.total_cells * BATCH_FRACTION))
+        self.rng = np.random.default_rng(seed)
+
+    def touched_by(self, cells):
+        # Соседи клеток cells без повторов и без sink. Повторы убираются без сортировки:
+        # в last_seen остаётся позиция последнего вхождения, у sink она сбрасывается
+        touched = self.neighbors[cells].ravel()
+        positions = np.arange(len(touched))
+        self.last_seen[touched] = positions
+        self.last_seen[self.sink] = -1
+        return touched[self.last_seen[touched] == positions]
+
+    def propagate(self, cells):
+        # cells - плоские индексы клеток, чьи домены только что сузились
+        domains = self.domains
+        flat_count = self.domain_count.reshape(-1)
+        pull = self.pull
+
+        while len(cells):
+            touched = self.touched_by(cells)
+            # Как и в построчном propagate(): коллапсированные клетки не трогаем
+            touched = touched[flat_count[touched] > 1]
+            old = domains[touched]
+            # Допустимые тайлы со всех четырёх сторон одной выборкой (K, 4), затем попарное &
+            allowed = pull[self.direction_index, domains[self.neighbors[touched]]]
+            new = old & (allowed[:, 0] & allowed[:, 1]) & (allowed[:, 2] & allowed[:, 3])
+
+            # Клетку, у которой не осталось бы ни одного тайла, оставляем как есть
+            changed = (new != old) & (new != 0)
+            cells = touched[changed]
+            new = new[changed]
+            domains[cells] = new
+            remaining = self.sizes[new]
+            flat_count[cells] = remaining
+            # Клетки, которым остался один тайл, сразу идут в счётчики, как в WFC_generator.py
+            forced = new[remaining == 1]
+            if len(forced):
+                self.tile_counts += np.bincount(self.tile_index[forced], minlength=len(self.tile_types))
+
+    def place_road(self, path):
+        if self.road < 0:
+            raise ValueError("в наборе правил нет тайла дороги R")
+        flat = np.array([y * self.width + x for x, y in path], dtype=np.int64)
+        flat = np.unique(flat)
+        self.road_cells.reshape(-1)[flat] = True
+        self.collapse_cells(flat, np.full(len(flat), self.road))
+
+    def collapse_cells(self, cells, chosen):
+        # При fallback клетка может получить тайл, которого не было в домене:
+        # соседи всё равно пересчитываются от нового домена
+        self.domains[cells] = self.bits[chosen]
+        self.domain_count.reshape(-1)[cells] = 1
+        self.tile_counts += np.bincount(chosen, minlength=len(self.tile_types))
+        self.propagate(cells)
+
+    def road_neighbor_counts(self, cells):
+        # Число уже готовых дорожных клеток вокруг каждой из клеток cells
+        return (self.domains[self.neighbors[cells]] == self.road_bit).sum(axis=1)
+
+    def tile_scores(self):
+        # Веса тайлов с множителями WFC_sampler.steer_factor() по счётчикам перед пачкой
+        decided = int(self.tile_counts.sum())
+        factors = [WFC_sampler.steer_factor(count, low, high, decided, self.total_cells)
+                   for count, low, high in zip(self.tile_counts.tolist(), self.min_counts, self.max_counts)]
+        # Тайлы с нулевым весом выбираются, только если в клетке больше ничего нет,
+        # как у QuotaSampler
+        return np.maximum(self.weights * np.array(factors), 1e-12)
+
+    def choose_tiles(self, available, scores):
+        # Взвешенный выбор по строкам available: у каждого тайла случайный ключ
+        # Exp(1) / вес, выбирается наименьший (то же распределение, что у bisect по весам)
+        keys = self.rng.exponential(size=available.shape) / scores
+        keys[~available] = np.inf
+        return keys.argmin(axis=1)
+
+    def collapse_cell(self, ys, xs):
+        # Пачечный аналог collapse_cell() из WFC_generator.py с теми же правилами выбора,
+        # что у WFC_sampler.QuotaSampler: веса, множители за отставание от минимума,
+        # исключение тайлов, набравших максимум
+        cells = ys * self.width + xs
+        options = (self.domains[cells, None] & self.bits) != 0
+
+        if self.road >= 0:
+            options[~self.road_cells[ys, xs], self.road] = False
+
+        available = options & (self.tile_counts < self.max_counts)
+        exhausted = ~available.any(axis=1)
+        available[exhausted] = options[exhausted]
+
+        if self.road >= 0:
+            crossroads = available[:, self.road] & (self.road_neighbor_counts(cells) >= 2)
+            available[crossroads, self.road] = False
+
+        available[~available.any(axis=1), self.fallback] = True
+
+        scores = self.tile_scores()
+        chosen = self.choose_tiles(available, scores)
+
+        # Пачка не должна перескочить максимум: лишние клетки тайла выбирают заново без него
+        room = np.maximum(np.ceil(self.max_counts - self.tile_counts), 0)
+        excess = np.bincount(chosen, minlength=len(self.tile_types)) - room
+        for tile in np.nonzero(excess > 0)[0]:
+            rows = np.nonzero(chosen == tile)[0]
+            rows = self.rng.choice(rows, int(excess[tile]), replace=False)
+            others = available[rows].copy()
+            others[:, tile] = False
+            rows = rows[others.any(axis=1)]
+            if len(rows):
+                others = others[others.any(axis=1)]
+                chosen[rows] = self.choose_tiles(others, scores)
+        self.collapse_cells(cells, chosen)
+
+    def find_lowest_entropy_cells(self):
+        # Пачка из клеток минимальной энтропии по всей карте. У каждой открытой клетки
+        # приоритет - энтропия плюс случайная добавка (равновероятный выбор среди равных);
+        # в пачку идут клетки с наименьшим приоритетом в ромбе NEAR_OFFSETS вокруг себя.
+        # Так две клетки пачки не зажимают одну клетку между собой с двух сторон,
+        # а клетки низкой энтропии не ждут своей очереди
+        width, height = self.width, self.height
+        open_cells = self.domain_count > 1
+        count = int(open_cells.sum())
+        if not count:
+            return None
+
+        priority = self.priority
+        inner = priority[SPACING:-SPACING, SPACING:-SPACING]
+        inner.fill(np.inf)
+        inner[open_cells] = self.domain_count[open_cells] + self.rng.random(count) * 0.5
+        keep = open_cells
+        nearer = self.nearer
+        for dx, dy in NEAR_OFFSETS:
+            np.less(inner, priority[SPACING + dy:SPACING + dy + height, SPACING + dx:SPACING + dx + width],
+                    out=nearer)
+            keep &= nearer
+
+        ys, xs = np.nonzero(keep)
+        if len(ys) > self.batch_limit:
+            pick = np.argpartition(inner[ys, xs], self.batch_limit)[:self.batch_limit]
+            ys, xs = ys[pick], xs[pick]
+        return ys, xs
+
+    def step(self):
+        # Одна пачка коллапсов. Возвращает False, когда решать больше нечего
+        cells = self.find_lowest_entropy_cells()
+        if cells is None:
+            return False
+        ys, xs = cells
+        self.collapse_cell(ys, xs)
+        return True
+
+    def run(self):
+        while self.step():
+            pass
+        return self
+
+    def to_grid(self):
+        # Домены уже в формате WFC_generator.py, остаётся сложить их в сетку
+        return self.domains[:self.total_cells].reshape(self.height, self.width).tolist()
+
+    def get_tile_counts(self):
+        return {tile: int(count) for tile, count in zip(self.tile_types, self.tile_counts)}
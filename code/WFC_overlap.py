@@ -0,0 +1,334 @@
+import hashlib
+import heapq
+import os
+import random
+from collections import Counter
+
+import WFC_mapfile
+import WFC_ruleset
+import WFC_topology
+
+# Перекрывающаяся модель WFC: вместо таблицы tile_adjacency правила берутся из
+# примеров карт. Из примеров вырезаются все окна PATTERN_SIZE x PATTERN_SIZE (шаблоны),
+# новая карта составляется из шаблонов так, чтобы соседние шаблоны совпадали
+# на перекрытии, а частоты шаблонов были как в примерах
+
+# Примеры карт по умолчанию - карты из папки "exe files/generated_maps"
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'exe files', 'generated_maps')
+SAMPLE_FILES = [os.path.join(SAMPLES_DIR, 'generated_map.txt')]
+# Окна 3x3 на шумных примерах почти все уникальны, и модель просто копирует пример
+PATTERN_SIZE = 2
+# Сколько раз начинать заново при противоречии; последняя попытка доводит карту
+# до конца, пропуская противоречия, как propagate() в WFC_generator.py
+OVERLAP_ATTEMPTS = 10
+
+GRID_WIDTH, GRID_HEIGHT = 0, 0
+rows = []
+rng = random.Random()
+map_seed = None
+# Индекс шаблонов для текущих SAMPLE_FILES и PATTERN_SIZE, строится при первой генерации
+pattern_index = None
+
+
+def get_user_input():
+    while True:
+        try:
+            width = int(input("Введите ширину карты (например, 80): "))
+            height = int(input("Введите высоту карты (например, 40): "))
+            if width <= 0 or height <= 0:
+                print("Ошибка: размеры должны быть положительными числами.")
+                continue
+            return width, height
+        except ValueError:
+            print("Ошибка: введите целое число.")
+
+
+def parse_sample(content):
+    # Строки карты-примера из содержимого текстового файла
+    return [line.rstrip('\r\n') for line in content.decode('ascii').splitlines() if line.strip()]
+
+
+def window_codes(cells, n, base):
+    # Коды всех окон n x n карты cells (строки индексов палитры) скользящим хешем.
+    # Код окна - число в системе счисления base, цифры - тайлы окна строка за строкой,
+    # так что разные окна никогда не совпадают. Сначала считаем коды отрезков
+    # длины n в каждой строке, затем так же складываем n отрезков друг под другом
+    height, width = len(cells), len(cells[0])
+    high = base ** (n - 1)
+    row_codes = []
+    for row in cells:
+        code = 0
+        for x in range(n):
+            code = code * base + row[x]
+        codes = [code]
+        for x in range(n, width):
+            code = (code - row[x - n] * high) * base + row[x]
+            codes.append(code)
+        row_codes.append(codes)
+
+    column_base = base ** n
+    column_high = column_base ** (n - 1)
+    windows = [[0] * (width - n + 1) for _ in range(height - n + 1)]
+    for x in range(width - n + 1):
+        code = 0
+        for y in range(n):
+            code = code * column_base + row_codes[y][x]
+        windows[0][x] = code
+        for y in range(n, height):
+            code = (code - row_codes[y - n][x] * column_high) * column_base + row_codes[y][x]
+            windows[y - n + 1][x] = code
+    return windows
+
+
+def bit_mask(indices, size):
+    # Битовая маска из списка номеров за один проход, без цепочки операций | над длинными числами
+    bits = bytearray((size + 7) // 8)
+    for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class PatternIndex:
+    # Шаблоны примеров без повторов, их частоты и пропагатор: для каждого
+    # направления и шаблона - битовая маска шаблонов, которые могут стоять
+    # с ним рядом в этом направлении
+
+    def __init__(self, samples, n):
+        self.n = n
+        self.palette = sorted(set(''.join(''.join(sample) for sample in samples)))
+        base = len(self.palette)
+        index = {tile: i for i, tile in enumerate(self.palette)}
+
+        frequencies = Counter()
+        for sample in samples:
+            if len(sample) < n or min(len(row) for row in sample) < n:
+                continue
+            width = min(len(row) for row in sample)
+            cells = [[index[tile] for tile in row[:width]] for row in sample]
+            for codes in window_codes(cells, n, base):
+                frequencies.update(codes)
+        if not frequencies:
+            raise ValueError(f"в примерах нет ни одного окна {n}x{n}")
+
+        self.codes = sorted(frequencies)
+        self.weights = [frequencies[code] for code in self.codes]
+        self.patterns = [self.decode(code, base) for code in self.codes]
+        self.propagator = []
+        self.groups = []
+        for dx, dy in WFC_topology.SQUARE_STEPS:
+            propagator, groups = self.build_direction(dx, dy)
+            self.propagator.append(propagator)
+            self.groups.append(groups)
+        self.hash = hashlib.sha256(repr((n, self.palette, self.codes)).encode()).digest()[:8]
+
+    def decode(self, code, base):
+        # Код окна -> тайлы окна строка за строкой (индексы палитры)
+        digits = []
+        for _ in range(self.n * self.n):
+            code, digit = divmod(code, base)
+            digits.append(digit)
+        return digits[::-1]
+
+    def overlap(self, pattern, dx, dy):
+        # Часть окна, которая перекрывается с соседом в направлении (dx, dy)
+        n = self.n
+        return tuple(pattern[y * n + x]
+                     for y in range(max(0, dy), n + min(0, dy))
+                     for x in range(max(0, dx), n + min(0, dx)))
+
+    def build_direction(self, dx, dy):
+        # Шаблон q может стоять в направлении (dx, dy) от шаблона p, если их окна
+        # совпадают на перекрытии. Группируем шаблоны по перекрытию, поэтому
+        # пропагатор строится за один проход, а не сравнением всех пар.
+        # Кроме пропагатора возвращает группы (маска шаблонов p с одинаковым
+        # перекрытием, маска допустимых для них соседей)
+        neighbors = {}
+        for q, pattern in enumerate(self.patterns):
+            neighbors.setdefault(self.overlap(pattern, -dx, -dy), []).append(q)
+        members = {}
+        for p, pattern in enumerate(self.patterns):
+            members.setdefault(self.overlap(pattern, dx, dy), []).append(p)
+
+        # Маска каждой группы строится один раз, шаблоны группы делят её между собой
+        size = len(self.patterns)
+        propagator = [0] * size
+        groups = []
+        for key, group in members.items():
+            allowed = bit_mask(neighbors.get(key, ()), size)
+            for p in group:
+                propagator[p] = allowed
+            groups.append((bit_mask(group, size), allowed))
+        return propagator, groups
+
+
+def load_index():
+    # Индекс строится долго, поэтому кешируется на диске по содержимому примеров
+    # (см. WFC_ruleset.cached()), а в процессе - до смены SAMPLE_FILES или PATTERN_SIZE
+    global pattern_index
+    key = (tuple(SAMPLE_FILES), PATTERN_SIZE)
+    if pattern_index is None or pattern_index[0] != key:
+        contents = []
+        for filename in SAMPLE_FILES:
+            with open(filename, 'rb') as f:
+                contents.append(f.read())
+        samples = [parse_sample(content) for content in contents]
+        content = b'%d\0' % PATTERN_SIZE + b'\0'.join(contents)
+        index = WFC_ruleset.cached('patterns', content, lambda: PatternIndex(samples, PATTERN_SIZE))
+        pattern_index = (key, index)
+    return pattern_index[1]
+
+
+class OverlapSolver:
+    # Решатель на битовых масках шаблонов: домен клетки - целое число,
+    # бит q означает, что в клетке ещё возможен шаблон q
+
+    def __init__(self, index, width, height, rng, strict=True):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.rng = rng
+        self.strict = strict
+        all_patterns = (1 << len(index.codes)) - 1
+        self.wave = [all_patterns] * (width * height)
+        # Объединения пропагатора по доменам: одни и те же домены встречаются часто
+        self.allowed_cache = [{} for _ in WFC_topology.SQUARE_STEPS]
+        self.heap = []
+
+    def allowed(self, domain, direction):
+        cache = self.allowed_cache[direction]
+        result = cache.get(domain)
+        if result is None:
+            result = 0
+            groups = self.index.groups[direction]
+            if domain.bit_count() > len(groups):
+                # Большой домен: быстрее пройти по группам с общим перекрытием
+                for members, neighbors in groups:
+                    if domain & members:
+                        result |= neighbors
+            else:
+                propagator = self.index.propagator[direction]
+                rest = domain
+                while rest:
+                    low = rest & -rest
+                    result |= propagator[low.bit_length() - 1]
+                    rest ^= low
+            cache[domain] = result
+        return result
+
+    def push(self, cell):
+        heapq.heappush(self.heap, (self.wave[cell].bit_count(), self.rng.random(), cell))
+
+    def observe(self):
+        # Клетка с наименьшим числом шаблонов (записи кучи для изменившихся клеток устаревают)
+        while self.heap:
+            count, _, cell = heapq.heappop(self.heap)
+            if count > 1 and self.wave[cell].bit_count() == count:
+                break
+        else:
+            return None
+
+        domain = self.wave[cell]
+        choices = []
+        rest = domain
+        while rest:
+            low = rest & -rest
+            choices.append(low.bit_length() - 1)
+            rest ^= low
+        weights = [self.index.weights[p] for p in choices]
+        chosen = self.rng.choices(choices, weights)[0]
+        self.wave[cell] = 1 << chosen
+        return cell
+
+    def propagate(self, cell):
+        # Возвращает False при противоречии (только при strict=True)
+        width, height = self.width, self.height
+        stack = [cell]
+        while stack:
+            cell = stack.pop()
+            x, y = cell % width, cell // width
+            domain = self.wave[cell]
+            for direction, (dx, dy) in enumerate(WFC_topology.SQUARE_STEPS):
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                neighbor = ny * width + nx
+                old = self.wave[neighbor]
+                new = old & self.allowed(domain, direction)
+                if new == old:
+                    continue
+                if not new:
+                    if self.strict:
+                        return False
+                    continue
+                self.wave[neighbor] = new
+                self.push(neighbor)
+                stack.append(neighbor)
+        return True
+
+    def run(self):
+        for cell in range(len(self.wave)):
+            self.push(cell)
+        while True:
+            cell = self.observe()
+            if cell is None:
+                return True
+            if not self.propagate(cell):
+                return False
+
+    def to_rows(self):
+        # Тайл клетки - левый верхний тайл её шаблона
+        palette = self.index.palette
+        patterns = self.index.patterns
+        return [''.join(palette[patterns[(self.wave[y * self.width + x] & -self.wave[y * self.width + x])
+                                         .bit_length() - 1][0]]
+                        for x in range(self.width))
+                for y in range(self.height)]
+
+
+def generate_map(width, height, seed=None):
+    # Генерация без ввода с клавиатуры и без сохранения, одинаковый seed - одинаковая карта
+    global GRID_WIDTH, GRID_HEIGHT, rows, map_seed
+    map_seed = seed if seed is not None else random.randrange(2 ** 63)
+    rng.seed(map_seed)
+    GRID_WIDTH, GRID_HEIGHT = width, height
+    index = load_index()
+
+    for attempt in range(OVERLAP_ATTEMPTS):
+        solver = OverlapSolver(index, width, height, rng, strict=attempt < OVERLAP_ATTEMPTS - 1)
+        if solver.run():
+            break
+    rows = solver.to_rows()
+
+
+def map_rows():
+    return rows
+
+
+def save_map_to_file(filename="generated_map_overlap.txt"):
+    with open(filename, 'w') as f:
+        f.write('\n'.join(map_rows()) + '\n')
+    print(f"Карта сохранена в {filename}")
+
+
+def map_binary(compression='zlib'):
+    index = load_index()
+    return WFC_mapfile.encode_map(map_rows(), index.palette, map_seed, index.hash, compression)
+
+
+def save_map_binary(filename="generated_map_overlap.wfcm", compression='zlib'):
+    with open(filename, 'wb') as f:
+        f.write(map_binary(compression))
+    print(f"Карта сохранена в {filename}")
+
+
+def main():
+    index = load_index()
+    print(f"Шаблонов {PATTERN_SIZE}x{PATTERN_SIZE} в примерах: {len(index.codes)}")
+    print(f"Генерация карты {GRID_WIDTH}x{GRID_HEIGHT}...")
+    generate_map(GRID_WIDTH, GRID_HEIGHT)
+    save_map_to_file()
+
+
+if __name__ == "__main__":
+    GRID_WIDTH, GRID_HEIGHT = get_user_input()
+    main()
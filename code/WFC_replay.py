@@ -0,0 +1,307 @@
+import argparse
+import json
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+import WFC_generator
+import WFC_mapfile
+import WFC_ruleset
+import WFC_topology
+
+# Журнал коллапсов: как была получена карта. Генератор с log=CollapseLog() записывает
+# каждый шаг решателя (номер клетки в корзине минимальной энтропии и выбранный тайл),
+# клетки дороги и время от времени состояние генератора случайных чисел.
+# Replayer восстанавливает по журналу состояние карты на любом шаге: он повторяет
+# только коллапсы и распространение, клетку не ищет и тайл не выбирает.
+#
+#   log = WFC_replay.CollapseLog()
+#   generator = WFC_generator.WFCGenerator(ruleset, 200, 200, seed=1, log=log)
+#   generator.run()
+#   log.write('map.wfcl')
+#
+#   replayer = WFC_replay.Replayer(WFC_replay.read_log('map.wfcl'))
+#   replayer.seek(5000)          # состояние после 5000 шагов: replayer.generator
+#   replayer.finish()            # до конца с постобработкой, True - карта совпала
+#
+#   python WFC_replay.py map.wfcl --step 5000 --output state.txt
+#
+# Вместо номера клетки пишется её место в корзине: в корзине минимальной энтропии
+# обычно единицы-десятки клеток, так что шаг почти всегда занимает один байт varint
+# и после zlib журнал выходит около байта на шаг. Повтор поэтому должен идти тем же
+# кодом решателя, что и генерация: хеш правил и контрольная сумма карты это проверяют.
+# Журнал покрывает карты, решённые с нуля: load_grid(), constrain() и reopen()
+# в него не попадают (параллельная генерация, чанки, движок numpy, многоуровневая)
+
+MAGIC = b'WFCL'
+VERSION = 1
+# Сигнатура, версия, длина описания в JSON; дальше - описание и сжатые потоки
+HEADER = struct.Struct('<4sBI')
+STREAMS = ('positions', 'tiles', 'roads', 'checkpoints')
+
+# Раз в столько шагов сохраняется состояние генератора случайных чисел (2.5 КБ):
+# с такого шага повтор можно продолжить обычным решателем, см. Replayer.resume()
+CHECKPOINT_STEPS = 65536
+# Сколько снимков состояния держит Replayer для перемотки назад и не реже
+# скольких шагов их делать: перемотка повторяет не больше интервала между снимками
+KEYFRAMES = 32
+KEYFRAME_MIN_STEPS = 1024
+# Состояние random.Random (Mersenne Twister): 624 слова и позиция в них
+RNG_STATE_WORDS = 625
+
+
+def encode_varints(values):
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append(value & 0x7f | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data):
+    values = array('I')
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class CollapseLog:
+    # Журнал одной карты. Во время генерации его заполняет WFCGenerator,
+    # после чтения из файла (read_log) - готовые массивы для Replayer
+
+    def __init__(self, checkpoint_steps=CHECKPOINT_STEPS):
+        self.checkpoint_steps = checkpoint_steps
+        self.meta = {}
+        self.positions = array('I')
+        self.tiles = bytearray()
+        # Дороги: (шаг, номера клеток в порядке place_road)
+        self.roads = []
+        # Шаг -> состояние random.Random перед этим шагом
+        self.checkpoints = {}
+        self.tile_index = {}
+
+    @property
+    def steps(self):
+        return len(self.positions)
+
+    def begin(self, generator):
+        ruleset = generator.ruleset
+        self.tile_index = {tile: index for index, tile in enumerate(generator.tile_bits)}
+        self.meta = {
+            'ruleset': ruleset.name,
+            'rules_hash': WFC_mapfile.ruleset_hash(ruleset.tile_types, ruleset.adjacency,
+                                                   ruleset.percentage_ranges).hex(),
+            'tiles': list(generator.tile_bits),
+            'topology': generator.topology.name,
+            'width': generator.width,
+            'height': generator.height,
+            'depth': generator.depth,
+            'seed': str(generator.seed),
+            'checkpoint_steps': self.checkpoint_steps,
+        }
+
+    def road(self, cells):
+        self.roads.append((self.steps, array('I', cells)))
+
+    def started(self, generator):
+        # Бюджет откатов берётся на старте: его могут поменять уже после создания генератора
+        self.meta['backtrack_limit'] = generator.backtrack_limit
+        self.checkpoint(generator.rng)
+
+    def collapsed(self, position, tile, rng):
+        # Вызывается из collapse_cell() после выбора тайла: дальше в шаге случайные
+        # числа не тратятся, так что состояние rng - уже состояние перед следующим шагом
+        self.positions.append(position)
+        self.tiles.append(self.tile_index[tile])
+        if len(self.positions) % self.checkpoint_steps == 0:
+            self.checkpoint(rng)
+
+    def checkpoint(self, rng):
+        self.checkpoints[self.steps] = array('I', rng.getstate()[1])
+
+    def finished(self, generator):
+        self.meta['steps'] = self.steps
+        self.meta['backtracks'] = generator.backtracks
+        self.meta['checksum'] = zlib.crc32(array('I', generator.cells))
+
+    def encode(self):
+        roads = array('I')
+        for step, cells in self.roads:
+            roads.extend((step, len(cells)))
+            roads.extend(cells)
+        checkpoints = array('I')
+        for step, state in sorted(self.checkpoints.items()):
+            checkpoints.append(step)
+            checkpoints.extend(state)
+        streams = {
+            'positions': encode_varints(self.positions),
+            'tiles': bytes(self.tiles),
+            'roads': roads.tobytes(),
+            'checkpoints': checkpoints.tobytes(),
+        }
+        body = [zlib.compress(streams[name], 9) for name in STREAMS]
+        meta = dict(self.meta, streams=[len(data) for data in body])
+        meta = json.dumps(meta).encode()
+        return b''.join([HEADER.pack(MAGIC, VERSION, len(meta)), meta] + body)
+
+    def write(self, filename):
+        data = self.encode()
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return len(data)
+
+
+def decode_log(data):
+    magic, version, meta_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("не журнал коллапсов WFC или неизвестная версия")
+    offset = HEADER.size
+    meta = json.loads(data[offset:offset + meta_size])
+    offset += meta_size
+    streams = {}
+    for name, size in zip(STREAMS, meta.pop('streams')):
+        streams[name] = zlib.decompress(data[offset:offset + size])
+        offset += size
+
+    log = CollapseLog(meta['checkpoint_steps'])
+    log.meta = meta
+    log.tile_index = {tile: index for index, tile in enumerate(meta['tiles'])}
+    log.positions = decode_varints(streams['positions'])
+    log.tiles = bytearray(streams['tiles'])
+    roads = array('I', streams['roads'])
+    i = 0
+    while i < len(roads):
+        step, count = roads[i], roads[i + 1]
+        log.roads.append((step, roads[i + 2:i + 2 + count]))
+        i += 2 + count
+    checkpoints = array('I', streams['checkpoints'])
+    for i in range(0, len(checkpoints), RNG_STATE_WORDS + 1):
+        log.checkpoints[checkpoints[i]] = checkpoints[i + 1:i + 1 + RNG_STATE_WORDS]
+    return log
+
+
+def read_log(filename):
+    with open(filename, 'rb') as f:
+        return decode_log(f.read())
+
+
+class Replayer:
+    # Карта из журнала на любом шаге: replayer.generator - обычный WFCGenerator
+    # в состоянии после replayer.position шагов. Вперёд повтор идёт шагами журнала,
+    # назад - от ближайшего снимка состояния (WFCGenerator.snapshot())
+
+    def __init__(self, log, ruleset=None, track_changes=False):
+        meta = log.meta
+        self.log = log
+        self.ruleset = ruleset if ruleset is not None else WFC_ruleset.load_ruleset(meta['ruleset'])
+        rules_hash = WFC_mapfile.ruleset_hash(self.ruleset.tile_types, self.ruleset.adjacency,
+                                              self.ruleset.percentage_ranges).hex()
+        if rules_hash != meta['rules_hash']:
+            raise ValueError(f"журнал записан с другими правилами {meta['ruleset']!r}")
+        self.tiles = meta['tiles']
+        self.roads = {}
+        for step, cells in log.roads:
+            self.roads.setdefault(step, []).append(cells)
+        self.track_changes = track_changes
+        self.interval = max(KEYFRAME_MIN_STEPS, -(-log.steps // KEYFRAMES))
+        self.keyframes = {}
+
+        topology = WFC_topology.make_topology(meta['topology'], meta['width'], meta['height'], meta['depth'])
+        self.generator = WFC_generator.WFCGenerator(self.ruleset, meta['width'], meta['height'], meta['seed'],
+                                                    roads=False, topology=topology)
+        self.generator.backtrack_limit = meta['backtrack_limit']
+        self.generator.started = True
+        if track_changes:
+            self.generator.track_changes()
+        self.position = 0
+        self.place_roads()
+        self.keyframes[0] = self.generator.snapshot()
+
+    @property
+    def steps(self):
+        return self.log.steps
+
+    def place_roads(self):
+        topology = self.generator.topology
+        for cells in self.roads.get(self.position, ()):
+            self.generator.place_road([topology.coords(cell) for cell in cells])
+
+    def step(self):
+        # Один шаг журнала вперёд. Возвращает False в конце журнала
+        if self.position >= self.steps:
+            return False
+        position = self.position
+        self.generator.replay_step(self.log.positions[position], self.tiles[self.log.tiles[position]])
+        self.position += 1
+        self.place_roads()
+        if self.position % self.interval == 0 and self.position not in self.keyframes:
+            self.keyframes[self.position] = self.generator.snapshot()
+        return True
+
+    def seek(self, step):
+        # Состояние после step шагов (step обрезается до длины журнала)
+        step = max(0, min(step, self.steps))
+        keyframe = max(position for position in self.keyframes if position <= step)
+        if step < self.position or keyframe > self.position or self.generator.finished:
+            self.generator.restore(self.keyframes[keyframe])
+            self.position = keyframe
+        while self.position < step:
+            self.step()
+        return self.generator
+
+    def finish(self):
+        # Повтор до конца с постобработкой. True, если карта совпала с записанной
+        self.seek(self.steps)
+        self.generator.finish()
+        return zlib.crc32(array('I', self.generator.cells)) == self.log.meta.get('checksum')
+
+    def resume(self):
+        # Генератор, который продолжает решать карту обычным step() с текущего шага.
+        # Возможно только на шагах с сохранённым состоянием rng (кратных CHECKPOINT_STEPS
+        # и на шаге 0); с тем же кодом решатель дойдёт до той же карты
+        state = self.log.checkpoints.get(self.position)
+        if state is None:
+            raise ValueError(f"на шаге {self.position} нет состояния генератора случайных чисел")
+        self.generator.rng.setstate((3, tuple(state), None))
+        return self.generator
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Повтор карты по журналу коллапсов")
+    parser.add_argument('log', help="файл журнала (.wfcl)")
+    parser.add_argument('--step', type=int, default=None,
+                        help="восстановить состояние после этого шага (по умолчанию - вся карта)")
+    parser.add_argument('--output', default=None, help="сохранить карту на этом шаге в текстовый файл")
+    args = parser.parse_args(argv)
+
+    log = read_log(args.log)
+    meta = log.meta
+    print(f"Карта {meta['width']}x{meta['height']}, правила {meta['ruleset']}, seed {meta['seed']}: "
+          f"{log.steps} шагов, {meta.get('backtracks', 0)} откатов")
+    start = time.perf_counter()
+    replayer = Replayer(log)
+    if args.step is None:
+        matched = replayer.finish()
+        print(f"Повтор за {time.perf_counter() - start:.2f} с, карта {'совпала' if matched else 'НЕ совпала'}")
+    else:
+        replayer.seek(args.step)
+        print(f"Шаг {replayer.position} восстановлен за {time.perf_counter() - start:.2f} с")
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n'.join(replayer.generator.map_rows()) + '\n')
+        print(f"Карта сохранена в файл {args.output}")
+    return 0 if args.step is not None or matched else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import heapq
+
+import WFC_topology
+
+# Планировщик дорожной сети. Дороги прокладываются до запуска WFC, поэтому
+# рельеф для них задаётся полем стоимости из шума: клетки "в горах" дороже,
+# и дорога их обходит. Города соединяются минимальным остовным деревом,
+# каждое ребро дерева прокладывается A* с учётом уже готовых дорог
+
+# Клетки решётки шума, по которым интерполируется поле стоимости
+NOISE_SCALE = 16
+# Стоимость клетки: 1 + TERRAIN_COST * шум (шум от 0 до 1)
+TERRAIN_COST = 3.0
+# Стоимость шага по уже проложенной дороге: новые дороги охотно к ней примыкают
+ROAD_REUSE_COST = 0.5
+# Добавка за клетку рядом с чужой дорогой, чтобы дороги не шли вплотную
+ROAD_SIDE_COST = 4.0
+# Множитель эвристики A*. 1 - кратчайший путь, но поиск обходит огромную область;
+# при средней стоимости клетки путь почти не длиннее, а поиск идёт узким коридором
+HEURISTIC_WEIGHT = 1 + TERRAIN_COST / 2
+
+
+class CostField:
+    # Поле стоимости из шума значений: случайные числа в узлах редкой решётки
+    # и билинейная интерполяция между ними. Считается только для клеток,
+    # до которых дошёл поиск, поэтому большой карте не нужен массив на все клетки
+
+    def __init__(self, width, height, rng):
+        self.columns = width // NOISE_SCALE + 2
+        rows = height // NOISE_SCALE + 2
+        self.nodes = [rng.random() for _ in range(self.columns * rows)]
+
+    def cost(self, x, y):
+        gx, fx = divmod(x, NOISE_SCALE)
+        gy, fy = divmod(y, NOISE_SCALE)
+        fx /= NOISE_SCALE
+        fy /= NOISE_SCALE
+        i = gy * self.columns + gx
+        top = self.nodes[i] + (self.nodes[i + 1] - self.nodes[i]) * fx
+        bottom = self.nodes[i + self.columns] + (self.nodes[i + self.columns + 1] - self.nodes[i + self.columns]) * fx
+        return 1 + TERRAIN_COST * (top + (bottom - top) * fy)
+
+
+def minimum_spanning_tree(towns):
+    # Алгоритм Прима на полном графе городов с манхэттенским расстоянием
+    if not towns:
+        return []
+    best = {i: (abs(towns[i][0] - towns[0][0]) + abs(towns[i][1] - towns[0][1]), 0)
+            for i in range(1, len(towns))}
+    edges = []
+    while best:
+        town = min(best, key=lambda i: best[i][0])
+        edges.append((best.pop(town)[1], town))
+        tx, ty = towns[town]
+        for other, (distance, _) in best.items():
+            d = abs(towns[other][0] - tx) + abs(towns[other][1] - ty)
+            if d < distance:
+                best[other] = (d, town)
+    return edges
+
+
+class RoadNetwork:
+
+    def __init__(self, width, height, rng):
+        self.width = width
+        self.height = height
+        self.field = CostField(width, height, rng)
+        self.cells = set()
+
+    def road_neighbors(self, x, y):
+        count = 0
+        for dx, dy in WFC_topology.SQUARE_STEPS:
+            if (x + dx, y + dy) in self.cells:
+                count += 1
+        return count
+
+    def blocked(self, px, py, x, y):
+        # Шаг (px, py) -> (x, y) запрещён, если даёт перекрёсток или квадрат дороги,
+        # как и too_many_road_neighbors() в генераторе: у готовой клетки дороги
+        # не может появиться четвёртый дорожный сосед, а два соседних шага вдоль
+        # готовой дороги образовали бы квадрат 2x2
+        cells = self.cells
+        if (x, y) in cells and (px, py) not in cells and self.road_neighbors(x, y) >= 3:
+            return True
+        if (px, py) in cells and (x, y) not in cells and self.road_neighbors(px, py) >= 3:
+            return True
+        if (x, y) not in cells:
+            for sx, sy in ((y - py, x - px), (py - y, px - x)):
+                if (px + sx, py + sy) in cells and (x + sx, y + sy) in cells:
+                    return True
+        return False
+
+    def step_cost(self, x, y):
+        if (x, y) in self.cells:
+            return ROAD_REUSE_COST
+        cost = self.field.cost(x, y)
+        if self.road_neighbors(x, y):
+            cost += ROAD_SIDE_COST
+        return cost
+
+    def find_path(self, start, goal, strict=True):
+        # A* на куче с взвешенным манхэттенским расстоянием в качестве эвристики.
+        # Со взвешенной эвристикой раскрытые клетки повторно не открываем,
+        # иначе число повторных раскрытий может расти лавинообразно.
+        # strict=False снимает запрет перекрёстков и квадратов (blocked()).
+        # Возвращает список клеток или None
+        gx, gy = goal
+        weight = HEURISTIC_WEIGHT
+        width, height = self.width, self.height
+        cost_so_far = {start: 0.0}
+        came_from = {start: None}
+        closed = set()
+        heap = [(weight * (abs(start[0] - gx) + abs(start[1] - gy)), 0.0, start)]
+
+        while heap:
+            _, g, cell = heapq.heappop(heap)
+            if cell == goal:
+                path = []
+                while cell is not None:
+                    path.append(cell)
+                    cell = came_from[cell]
+                return path[::-1]
+            if cell in closed:
+                continue
+            closed.add(cell)
+
+            x, y = cell
+            for dx, dy in WFC_topology.SQUARE_STEPS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height) or (nx, ny) in closed \
+                        or strict and self.blocked(x, y, nx, ny):
+                    continue
+                new_g = g + self.step_cost(nx, ny)
+                if new_g < cost_so_far.get((nx, ny), float('inf')):
+                    cost_so_far[(nx, ny)] = new_g
+                    came_from[(nx, ny)] = cell
+                    heapq.heappush(heap, (new_g + weight * (abs(nx - gx) + abs(ny - gy)), new_g, (nx, ny)))
+        return None
+
+    def connect(self, start, goal):
+        # Если готовые дороги отрезали город так, что без перекрёстка или квадрата
+        # к нему не пройти, лучше такая развязка, чем город без дороги
+        path = self.find_path(start, goal) or self.find_path(start, goal, strict=False)
+        if path is None:
+            raise ValueError(f"нет пути между {start} и {goal} на карте {self.width}x{self.height}")
+        self.cells.update(path)
+        return path
+
+
+def plan_roads(width, height, rng, towns=0):
+    # Дорожная сеть: концы на верхнем и нижнем краю карты, как у прежней
+    # одиночной дороги, плюс towns случайных городов внутри карты.
+    # Возвращает список клеток дорог без повторов
+    endpoints = [(rng.randint(0, width - 1), 0), (rng.randint(0, width - 1), height - 1)]
+    endpoints += [(rng.randint(0, width - 1), rng.randint(0, height - 1)) for _ in range(towns)]
+    endpoints = list(dict.fromkeys(endpoints))
+
+    network = RoadNetwork(width, height, rng)
+    for a, b in minimum_spanning_tree(endpoints):
+        network.connect(endpoints[a], endpoints[b])
+    return sorted(network.cells, key=lambda cell: (cell[1], cell[0]))
@@ -0,0 +1,98 @@
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import WFC_topology
+
+# Правила постобработки готовой карты. Тайл source превращается в target, если:
+#   all_of - все 4 соседа из этого набора тайлов (край карты подходит);
+#   any_of - для каждого набора из списка есть хотя бы один сосед из него.
+# Все правила одного вызова apply_rules() проверяются по одному снимку карты,
+# поэтому независимые проходы выполняются вместе за один проход. Если под одну
+# клетку подходят несколько правил, срабатывает первое из списка
+Rule = namedtuple('Rule', 'source target all_of any_of', defaults=(None, ()))
+
+
+def tiles_mask(tiles, tile_bits):
+    mask = 0
+    for tile in tiles:
+        mask |= tile_bits[tile]
+    return mask
+
+
+def neighbor_arrays(cells):
+    # Сдвинутые копии карты: для каждой клетки её сосед в направлении (dx, dy),
+    # за краем карты 0 (ни одного тайла)
+    padded = np.pad(cells, 1)
+    height, width = cells.shape
+    return [padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width] for dx, dy in WFC_topology.SQUARE_STEPS]
+
+
+def match_numpy(cells, rules, tile_bits):
+    neighbors = neighbor_arrays(cells)
+    unmatched = np.ones(cells.shape, dtype=bool)
+    matches = []
+    for rule in rules:
+        hit = (cells == tile_bits[rule.source]) & unmatched
+        if rule.all_of is not None:
+            allowed = tiles_mask(rule.all_of, tile_bits)
+            for neighbor in neighbors:
+                hit &= (neighbor & allowed != 0) | (neighbor == 0)
+        for tiles in rule.any_of:
+            wanted = tiles_mask(tiles, tile_bits)
+            found = np.zeros(cells.shape, dtype=bool)
+            for neighbor in neighbors:
+                found |= neighbor & wanted != 0
+            hit &= found
+        unmatched &= ~hit
+        ys, xs = np.nonzero(hit)
+        matches.append((rule, xs.tolist(), ys.tolist()))
+    return matches
+
+
+def match_python(grid, rules, tile_bits):
+    # Запасной вариант без numpy с теми же правилами
+    height, width = len(grid), len(grid[0])
+    compiled = [
+        (index, tile_bits[rule.source],
+         None if rule.all_of is None else tiles_mask(rule.all_of, tile_bits),
+         [tiles_mask(tiles, tile_bits) for tiles in rule.any_of])
+        for index, rule in enumerate(rules)
+    ]
+    matches = [([], []) for _ in rules]
+
+    for y in range(height):
+        for x in range(width):
+            cell = grid[y][x]
+            for index, source, allowed, wanted in compiled:
+                if cell != source:
+                    continue
+                neighbors = [grid[y + dy][x + dx] for dx, dy in WFC_topology.SQUARE_STEPS
+                             if 0 <= x + dx < width and 0 <= y + dy < height]
+                if allowed is not None and any(not n & allowed for n in neighbors):
+                    continue
+                if not all(any(n & mask for n in neighbors) for mask in wanted):
+                    continue
+                matches[index][0].append(x)
+                matches[index][1].append(y)
+                break
+
+    return [(rule, xs, ys) for rule, (xs, ys) in zip(rules, matches)]
+
+
+def apply_rules(grid, rules, tile_bits):
+    # Применяет правила к сетке битовых масок grid на месте.
+    # Возвращает список (правило, xs, ys) с изменёнными клетками
+    if np is not None:
+        matches = match_numpy(np.array(grid, dtype=np.int64), rules, tile_bits)
+    else:
+        matches = match_python(grid, rules, tile_bits)
+
+    for rule, xs, ys in matches:
+        target = tile_bits[rule.target]
+        for x, y in zip(xs, ys):
+            grid[y][x] = target
+    return matches
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import WFC_rules
+import WFC_topology
+
+try:
+    import tomllib
+except ImportError:
+    # До Python 3.11 наборы правил читаются только из JSON
+    tomllib = None
+
+# Наборы правил лежат в папке rulesets рядом со скриптами: <имя>.json или <имя>.toml.
+# Формат (JSON, в TOML то же самое):
+#   "tiles": {
+#       "G": {"range": [15, 25], "weight": 1.0, "color": [0, 200, 0], "neighbors": ["G", "W"]},
+#       "S": {"generated": false, "color": [237, 201, 175]},  - только для постобработки
+#       "K": {..., "neighbors": ["K", "D"], "directions": {"above": ["K", "D"], "below": ["K"]}},
+#   },
+# directions - свои списки соседей для отдельных направлений топологии (см. WFC_topology.py),
+# в остальных направлениях действует neighbors.
+#   "post_rules": [{"source": "M", "target": "H", "all_of": "MH"}, ...]   - см. WFC_rules.py
+RULESETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rulesets')
+
+# Скомпилированные таблицы кешируются на диске по хешу содержимого исходных файлов,
+# поэтому процессы пула при старте только читают готовый файл.
+# CACHE_VERSION меняется вместе с форматом скомпилированных данных
+CACHE_DIR = os.path.join(RULESETS_DIR, '__pycache__')
+CACHE_VERSION = 2
+
+
+class Ruleset:
+    # Набор правил, скомпилированный в таблицы, которыми пользуются генераторы
+
+    def __init__(self, name, tiles, post_rules):
+        self.name = name
+        self.tile_types = [tile for tile, info in tiles.items() if info.get('generated', True)]
+        extra = [tile for tile in tiles if tile not in self.tile_types]
+
+        self.percentage_ranges = {tile: tuple(tiles[tile]['range'])
+                                  for tile in self.tile_types if 'range' in tiles[tile]}
+        self.weights = {tile: float(tiles[tile].get('weight', 1.0)) for tile in self.tile_types}
+        self.colors = {tile: tuple(info['color']) for tile, info in tiles.items() if 'color' in info}
+        self.adjacency = {tile: list(tiles[tile]['neighbors']) for tile in self.tile_types}
+        # Направление -> {тайл: соседи в этом направлении} для тайлов с полем directions
+        self.directions = {}
+        for tile in self.tile_types:
+            for direction, allowed in tiles[tile].get('directions', {}).items():
+                self.directions.setdefault(direction, {})[tile] = list(allowed)
+        self.post_rules = [WFC_rules.Rule(rule['source'], rule['target'], rule.get('all_of'),
+                                          tuple(rule.get('any_of', ())))
+                           for rule in post_rules]
+
+        # Домен клетки - битовая маска, тайлы только для постобработки получают биты после остальных
+        self.tile_bits = {tile: 1 << i for i, tile in enumerate(self.tile_types + extra)}
+        self.bit_tiles = {bit: tile for tile, bit in self.tile_bits.items()}
+        self.all_tiles_mask = (1 << len(self.tile_types)) - 1
+        self.allowed_neighbors = self.compile_adjacency(self.adjacency)
+        # Таблицы для направлений со своими списками соседей, остальные берут allowed_neighbors
+        self.direction_tables = {direction: self.compile_adjacency({**self.adjacency, **overrides})
+                                 for direction, overrides in self.directions.items()}
+        # Число тайлов в домене (энтропия) для каждой возможной маски
+        self.domain_sizes = [bin(domain).count('1') for domain in range(1 << len(self.tile_bits))]
+
+    def compile_adjacency(self, adjacency):
+        # Для каждого тайла собираем маску разрешённых соседей, а затем для каждого
+        # возможного домена - объединение масок его тайлов. propagate() берёт готовое значение
+        tile_masks = {}
+        for tile, allowed in adjacency.items():
+            tile_masks[self.tile_bits[tile]] = sum(self.tile_bits[t] for t in set(allowed))
+
+        allowed_by_domain = [0] * (1 << len(self.tile_bits))
+        for domain in range(1, len(allowed_by_domain)):
+            low_bit = domain & -domain
+            allowed_by_domain[domain] = allowed_by_domain[domain ^ low_bit] | tile_masks.get(low_bit, 0)
+        return allowed_by_domain
+
+    def allowed_in(self, direction):
+        # Домен клетки -> маска тайлов, допустимых у соседа в направлении direction
+        return self.direction_tables.get(direction, self.allowed_neighbors)
+
+
+def validate(name, data):
+    # Собирает все ошибки набора правил и выбрасывает их одним ValueError
+    errors = []
+    tiles = data.get('tiles')
+    if not isinstance(tiles, dict) or not tiles:
+        raise ValueError(f"{name}: нет таблицы tiles")
+
+    generated = [tile for tile, info in tiles.items() if info.get('generated', True)]
+    for tile, info in tiles.items():
+        if len(tile) != 1:
+            errors.append(f"тайл {tile!r}: имя тайла - один символ")
+        if not info.get('generated', True):
+            continue
+        neighbors = info.get('neighbors')
+        if not neighbors:
+            errors.append(f"тайл {tile}: не задан список neighbors")
+            continue
+        for other in neighbors:
+            if other not in generated:
+                errors.append(f"тайл {tile}: неизвестный сосед {other!r}")
+            elif tile not in tiles[other].get('neighbors', ()):
+                errors.append(f"несимметричное соседство: {tile} допускает {other}, а {other} не допускает {tile}")
+        if 'range' in info:
+            low, high = info['range']
+            if not 0 <= low <= high <= 100:
+                errors.append(f"тайл {tile}: неверный диапазон процентов {info['range']}")
+
+    # Списки соседей по направлениям: для каждого направления из directions (и обратного к нему)
+    # "B в направлении d от A" должно совпадать с "A в обратном направлении от B"
+    def neighbors_in(tile, direction):
+        return tiles[tile].get('directions', {}).get(direction, tiles[tile].get('neighbors', ()))
+
+    used = set()
+    for tile in generated:
+        for direction, allowed in tiles[tile].get('directions', {}).items():
+            if direction not in WFC_topology.OPPOSITE:
+                errors.append(f"тайл {tile}: неизвестное направление {direction!r}")
+                continue
+            used.update((direction, WFC_topology.OPPOSITE[direction]))
+            for other in allowed:
+                if other not in generated:
+                    errors.append(f"тайл {tile}: неизвестный сосед {other!r} в направлении {direction}")
+    for direction in sorted(used):
+        opposite = WFC_topology.OPPOSITE[direction]
+        for tile in generated:
+            for other in neighbors_in(tile, direction):
+                if other in generated and tile not in neighbors_in(other, opposite):
+                    errors.append(f"несимметричное соседство: {tile} допускает {other} в направлении {direction}, "
+                                  f"а {other} не допускает {tile} в направлении {opposite}")
+
+    if sum(tiles[tile].get('range', (0, 0))[0] for tile in generated) > 100:
+        errors.append("сумма минимальных процентов больше 100")
+
+    # Тайлы, которые не могут оказаться на карте: генерируемый тайл, который никто
+    # не допускает соседом, и тайл постобработки, в который не превращает ни одно правило
+    rules = data.get('post_rules', [])
+    targets = {rule.get('target') for rule in rules}
+    for tile, info in tiles.items():
+        if info.get('generated', True):
+            if not any(tile in tiles[other].get('neighbors', ()) for other in generated):
+                errors.append(f"тайл {tile} недостижим: его не допускает соседом ни один тайл")
+        elif tile not in targets:
+            errors.append(f"тайл {tile} недостижим: его не создаёт ни одно правило post_rules")
+
+    for rule in rules:
+        used = [rule.get('source'), rule.get('target')] + list(rule.get('all_of') or '')
+        used += [tile for group in rule.get('any_of', ()) for tile in group]
+        for tile in used:
+            if tile not in tiles:
+                errors.append(f"правило {rule}: неизвестный тайл {tile!r}")
+
+    if errors:
+        raise ValueError(f"{name}: ошибки в наборе правил:\n  " + "\n  ".join(errors))
+
+
+def cached(kind, content, build):
+    # Результат build(), сохранённый на диске под хешем content (bytes).
+    # Запись атомарная, так что одновременно стартующие процессы не видят
+    # недописанный файл: в худшем случае несколько из них скомпилируют одно и то же
+    digest = hashlib.sha256(b'%d:' % CACHE_VERSION + content).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{kind}-{digest}.pickle")
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    result = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, delete=False) as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, path)
+    except OSError:
+        # Без доступа на запись просто работаем без кеша
+        pass
+    return result
+
+
+def find_ruleset(name):
+    # Имя набора из папки rulesets или путь к файлу
+    if os.path.exists(name):
+        return name
+    for extension in ('.json', '.toml'):
+        path = os.path.join(RULESETS_DIR, name + extension)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"набор правил {name!r} не найден в {RULESETS_DIR}")
+
+
+def parse_ruleset(path, content):
+    if path.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError(f"{path}: для TOML нужен Python 3.11+, используйте JSON")
+        return tomllib.loads(content.decode('utf-8'))
+    return json.loads(content)
+
+
+def compile_ruleset(path, content):
+    data = parse_ruleset(path, content)
+    validate(path, data)
+    name = data.get('name', os.path.splitext(os.path.basename(path))[0])
+    return Ruleset(name, data['tiles'], data.get('post_rules', []))
+
+
+def load_ruleset(name):
+    path = find_ruleset(name)
+    with open(path, 'rb') as f:
+        content = f.read()
+    return cached('ruleset', content, lambda: compile_ruleset(path, content))
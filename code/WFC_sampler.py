@@ -0,0 +1,135 @@
+import math
+from bisect import bisect
+
+# Во сколько раз самое большее меняется вес тайла, который отстаёт от своего минимума
+# или обгоняет максимум из TILE_PERCENTAGE_RANGES
+MAX_BOOST = 16.0
+# Множители весов округляются до степеней этого шага, чтобы таблицы весов в кеше
+# переиспользовались, а не строились заново при каждом пересчёте
+BOOST_STEP = 2 ** 0.5
+# Множители пересчитываются раз в столько решённых клеток на каждую тысячу клеток карты
+# (но не реже чем раз в MIN_REBALANCE_CELLS)
+MIN_REBALANCE_CELLS = 16
+
+
+def steer_factor(count, min_count, max_count, decided, total_cells):
+    # Во сколько раз умножить вес тайла с count клетками из decided решённых (см. QuotaSampler)
+    factor = 1.0
+    if count < min_count:
+        # Доля среди решённых ниже минимальной или до минимума не хватает
+        # большей доли оставшихся клеток, чем минимальная
+        remaining = max(total_cells - decided, 1)
+        factor = max(min_count / max(count, 1) * max(decided, 1) / total_cells,
+                     (min_count - count) / remaining * total_cells / min_count)
+    if factor > 1.0:
+        return min(MAX_BOOST, factor)
+    if count > max_count * decided / total_cells:
+        return max(1 / MAX_BOOST, max_count * decided / total_cells / count)
+    return 1.0
+
+
+class QuotaSampler:
+    # Выбор тайла для коллапса с учётом весов и процентных ограничений.
+    # Счётчики меняются через update() за O(1): при пересечении максимума у тайла
+    # меняется один бит в маске closed_mask. Минимумы и максимумы ещё и подталкивают
+    # выбор: вес тайла умножается на то, во сколько раз он отстаёт от минимума
+    # (или обгоняет максимум). Отставание считается двумя способами и берётся большее:
+    # по доле среди уже решённых клеток и по тому, какая доля оставшихся клеток ещё
+    # нужна тайлу до минимума. Множители пересчитываются раз в rebalance_cells решённых
+    # клеток и округляются до степеней BOOST_STEP (уровни в boost_levels). Таблицы
+    # накопленных весов кешируются по (домен, closed_mask, boost_levels) и
+    # пересчитываются только для новых сочетаний
+
+    def __init__(self, tile_bits, percentage_ranges, total_cells, weights=None):
+        self.tile_bits = dict(tile_bits)
+        self.weights = {tile: 1.0 for tile in self.tile_bits}
+        self.weights.update(weights or {})
+        self.total_cells = total_cells
+
+        self.min_counts = {}
+        self.max_counts = {}
+        for tile, (min_p, max_p) in percentage_ranges.items():
+            self.min_counts[tile] = min_p * total_cells / 100
+            self.max_counts[tile] = max_p * total_cells / 100
+
+        self.counts = {tile: 0 for tile in self.tile_bits}
+        self.closed_mask = 0
+        self.decided = 0
+        self.rebalance_cells = max(MIN_REBALANCE_CELLS, total_cells // 1000)
+        self.rebalanced_at = 0
+        self.boost_levels = ()
+        self.boosts = {}
+        for tile in self.tile_bits:
+            self.update(tile, 0)
+        self.rebalance()
+        self.cache = {}
+
+    def update(self, tile, delta):
+        count = self.counts[tile] = self.counts[tile] + delta
+        bit = self.tile_bits[tile]
+        if tile in self.max_counts and count >= self.max_counts[tile]:
+            self.closed_mask |= bit
+        else:
+            self.closed_mask &= ~bit
+        self.decided += delta
+        if abs(self.decided - self.rebalanced_at) >= self.rebalance_cells:
+            self.rebalance()
+
+    def rebalance(self):
+        # Множители весов по текущим счётчикам
+        self.rebalanced_at = self.decided
+        levels = []
+        for tile, max_count in self.max_counts.items():
+            factor = steer_factor(self.counts[tile], self.min_counts[tile], max_count,
+                                  self.decided, self.total_cells)
+            levels.append(round(math.log(factor, BOOST_STEP)))
+        self.boost_levels = tuple(levels)
+        self.boosts = {tile: BOOST_STEP ** level for tile, level in zip(self.max_counts, levels) if level}
+
+    def state(self):
+        # Состояние для WFCGenerator.snapshot(): множители зависят от истории счётчиков
+        return dict(self.counts), self.decided, self.rebalanced_at, self.boost_levels
+
+    def restore(self, state):
+        counts, self.decided, self.rebalanced_at, levels = state
+        for tile in self.counts:
+            self.counts[tile] = counts.get(tile, 0)
+            bit = self.tile_bits[tile]
+            if tile in self.max_counts and self.counts[tile] >= self.max_counts[tile]:
+                self.closed_mask |= bit
+            else:
+                self.closed_mask &= ~bit
+        self.boost_levels = levels
+        self.boosts = {tile: BOOST_STEP ** level for tile, level in zip(self.max_counts, levels) if level}
+
+    def is_open(self, tile):
+        # Не превышен ли максимум для тайла
+        return not self.closed_mask & self.tile_bits[tile]
+
+    def build_table(self, mask):
+        candidates = [tile for tile, bit in self.tile_bits.items() if mask & bit]
+        # Если у всех вариантов исчерпан максимум, выбираем из всех, чтобы избежать тупика
+        open_tiles = [tile for tile in candidates if self.is_open(tile)] or candidates
+
+        tiles = []
+        cumulative = []
+        total = 0.0
+        for tile in open_tiles:
+            weight = self.weights[tile] * self.boosts.get(tile, 1.0)
+            if weight > 0:
+                total += weight
+                tiles.append(tile)
+                cumulative.append(total)
+
+        if not tiles:
+            tiles = open_tiles
+            cumulative = list(range(1, len(tiles) + 1))
+        return tiles, cumulative
+
+    def choose(self, mask, rng):
+        key = (mask, self.closed_mask, self.boost_levels)
+        table = self.cache.get(key)
+        if table is None:
+            table = self.cache[key] = self.build_table(mask)
+        tiles, cumulative = table
+        return tiles[bisect(cumulative, rng.random() * cumulative[-1])]
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import WFC_cli
+import WFC_image
+import WFC_mapfile
+import WFC_ruleset
+import WFC_txt
+
+# Локальный HTTP-сервер карт и чанков на asyncio, без сторонних библиотек:
+#   GET /map?ruleset=full&seed=5&width=80&height=40[&towns=3][&format=bin&compression=zlib]
+#   GET /chunk?seed=42&cx=0&cy=-1[&format=bin]
+#   format=png[&scale=4][&grid_lines=1] - картинка карты (WFC_image.py) в цветах её набора правил,
+#   scale пикселей на клетку и линии сетки, как --scale и --grid-lines у WFC_cli.py
+#   GET /stats  - счётчики кеша в JSON
+# Карты генерируются в пуле процессов, одинаковые запросы, пришедшие во время
+# генерации, ждут один и тот же результат. Готовые ответы лежат в LRU-кеше,
+# поэтому повторный запрос того же seed отдаётся без генерации
+
+# Ограничения параметров запроса
+MAX_MAP_SIZE = 2048
+MAX_TOWNS = 64
+MAX_SEED = WFC_mapfile.MAX_SEED
+# Пикселей на клетку у PNG: картинка растёт как квадрат масштаба
+MAX_PNG_SCALE = 16
+# Сколько миров чанков (по одному на seed) держать в памяти; самый старый мир
+# забывается целиком вместе с его чанками в кеше ответов, иначе его новые чанки
+# не сойдутся на швах со старыми
+MAX_WORLDS = 64
+# Наборы правил, которые отдаёт /map: объёмные карты voxel слишком велики для ответа
+RULESETS = [name for name in WFC_cli.RULESETS if name != 'voxel']
+
+CONTENT_TYPES = {'txt': 'text/plain; charset=ascii', 'bin': 'application/octet-stream', 'png': 'image/png'}
+
+
+def digest(*parts):
+    return hashlib.sha256(b'\0'.join(parts)).hexdigest()[:16]
+
+
+def rules_digest(ruleset):
+    # Хеш исходников набора правил: попадает в ключ кеша, и после правки
+    # правил дисковый кеш не отдаёт старые карты
+    if ruleset == 'overlap':
+        import WFC_overlap
+        contents = [b'%d' % WFC_overlap.PATTERN_SIZE]
+        for filename in WFC_overlap.SAMPLE_FILES:
+            with open(filename, 'rb') as f:
+                contents.append(f.read())
+        return digest(*contents)
+    with open(WFC_ruleset.find_ruleset(ruleset), 'rb') as f:
+        return digest(f.read())
+
+
+def encode_rows(rows, file_format, compression, palette=None, seed=None, rules_hash=b'', colors=None,
+                scale=1, grid_lines=False):
+    if file_format == 'bin':
+        return WFC_mapfile.encode_map(rows, palette, seed, rules_hash, compression)
+    if file_format == 'png':
+        return WFC_image.encode_png(rows, colors, scale, grid_lines)
+    return ('\n'.join(rows) + '\n').encode('ascii')
+
+
+def render_map(ruleset, seed, width, height, towns, scale, grid_lines, file_format, compression):
+    # Выполняется в процессе пула: у каждого процесса свой модуль набора правил
+    module = WFC_cli.load_module(ruleset, towns=towns)
+    module.generate_map(width, height, seed)
+    if file_format == 'bin':
+        return module.map_binary(compression)
+    return encode_rows(module.map_rows(), file_format, compression, colors=WFC_cli.ruleset_colors(module),
+                       scale=scale, grid_lines=grid_lines)
+
+
+# Готовые чанки по мирам: seed -> {(cx, cy): строки}. Чанк зависит от уже
+# готовых соседей, поэтому чанки генерируются по одному в отдельном потоке
+worlds = OrderedDict()
+
+
+def render_chunk(seed, cx, cy, scale, grid_lines, file_format, compression, forget=None):
+    # forget(seed) - вызывается для забытого мира, чтобы убрать его чанки из кеша
+    world = worlds.get(seed)
+    if world is None:
+        world = worlds[seed] = {}
+        if len(worlds) > MAX_WORLDS:
+            old_seed, _ = worlds.popitem(last=False)
+            if forget is not None:
+                forget(old_seed)
+    worlds.move_to_end(seed)
+    rows = WFC_txt.get_chunk(cx, cy, seed, world)
+    rules_hash = WFC_mapfile.ruleset_hash(WFC_txt.tile_types, WFC_txt.tile_adjacency,
+                                          WFC_txt.TILE_PERCENTAGE_RANGES)
+    return encode_rows(rows, file_format, compression, WFC_txt.tile_types + ['S', '?'], seed, rules_hash,
+                       WFC_txt.RULESET.colors, scale, grid_lines)
+
+
+class ResultCache:
+    # LRU закодированных ответов с ограничением по суммарному размеру. Если задана
+    # папка, ответы ещё и пишутся на диск (тоже с ограничением) и переживают перезапуск
+
+    def __init__(self, max_bytes, directory=None, max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_size = 0
+        # store() идёт из нескольких потоков сразу: счётчик размера и чистка под замком
+        self.disk_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_size = sum(entry.stat().st_size for entry in os.scandir(directory)
+                                 if entry.name.endswith('.bin'))
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if key in self.entries or len(data) > self.max_bytes:
+            return
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, old = self.entries.popitem(last=False)
+            self.size -= len(old)
+
+    def discard(self, match):
+        # Убирает из памяти ответы, ключи которых подходят под match(key)
+        for key in [key for key in self.entries if match(key)]:
+            self.size -= len(self.entries.pop(key))
+
+    def path(self, key):
+        return os.path.join(self.directory, digest(repr(key).encode()) + '.bin')
+
+    def load(self, key):
+        # Чтение с диска; время изменения файла служит временем последнего обращения
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def store(self, key, data):
+        # Атомарная запись, как в WFC_ruleset.cached(); при нехватке места
+        # удаляются файлы, к которым дольше всего не обращались
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+                f.write(data)
+            os.replace(f.name, self.path(key))
+            with self.disk_lock:
+                self.disk_size += len(data)
+                if self.disk_size > self.max_disk_bytes:
+                    self.trim_disk()
+        except OSError:
+            pass
+
+    def trim_disk(self):
+        # Вызывается под disk_lock
+        files = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                       for entry in os.scandir(self.directory) if entry.name.endswith('.bin'))
+        self.disk_size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.disk_size <= self.max_disk_bytes * 0.9:
+                break
+            os.remove(path)
+            self.disk_size -= size
+
+
+def int_param(query, name, default=None, low=None, high=None):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise ValueError(f"нужен параметр {name}")
+        return default
+    try:
+        value = int(values[-1])
+    except ValueError:
+        raise ValueError(f"{name}: ожидается целое число") from None
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ValueError(f"{name}: допустимо от {low} до {high}")
+    return value
+
+
+def choice_param(query, name, choices, default):
+    value = query.get(name, [default])[-1]
+    if value not in choices:
+        raise ValueError(f"{name}: допустимо {', '.join(sorted(choices))}")
+    return value
+
+
+class MapServer:
+
+    def __init__(self, cache, workers=None):
+        self.cache = cache
+        self.map_pool = ProcessPoolExecutor(workers)
+        self.chunk_pool = ThreadPoolExecutor(1)
+        # Генерации в процессе: ключ -> задача, её результат ждут все одинаковые запросы
+        self.inflight = {}
+        self.rules_digests = {}
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0}
+
+    def route(self, path, query):
+        # Ключ кеша и задача генерации для запроса; ValueError - неверный запрос
+        if path not in ('/map', '/chunk'):
+            return None
+        file_format = choice_param(query, 'format', CONTENT_TYPES, 'txt')
+        compression = choice_param(query, 'compression', WFC_mapfile.COMPRESSION, 'zlib')
+        seed = int_param(query, 'seed', low=0, high=MAX_SEED)
+        # Масштаб и сетка есть только у PNG, в остальных форматах они не попадают в ключ кеша
+        scale, grid_lines = 1, False
+        if file_format == 'png':
+            scale = int_param(query, 'scale', 1, 1, MAX_PNG_SCALE)
+            grid_lines = bool(int_param(query, 'grid_lines', 0, 0, 1))
+        if path == '/map':
+            ruleset = choice_param(query, 'ruleset', RULESETS, 'full')
+            width = int_param(query, 'width', 80, 1, MAX_MAP_SIZE)
+            height = int_param(query, 'height', 40, 1, MAX_MAP_SIZE)
+            towns = int_param(query, 'towns', 0, 0, MAX_TOWNS)
+            if ruleset not in self.rules_digests:
+                self.rules_digests[ruleset] = rules_digest(ruleset)
+            key = ('map', ruleset, self.rules_digests[ruleset], seed, width, height, towns, scale, grid_lines,
+                   file_format, compression)
+            return key, self.map_pool, render_map, (ruleset, seed, width, height, towns, scale, grid_lines,
+                                                    file_format, compression)
+
+        cx = int_param(query, 'cx', low=-2 ** 31, high=2 ** 31)
+        cy = int_param(query, 'cy', low=-2 ** 31, high=2 ** 31)
+        if 'full' not in self.rules_digests:
+            self.rules_digests['full'] = rules_digest('full')
+        # Чанки на диск не пишутся: мир чанков живёт только в памяти сервера.
+        # Кеш ответов меняется только в потоке цикла событий, поэтому забытый мир
+        # убирается из него через call_soon_threadsafe. Чанки генерируются в одном
+        # потоке по очереди, и ответ чанка забытого мира успевает попасть в кеш
+        # раньше, чем его оттуда уберут
+        key = ('chunk', self.rules_digests['full'], seed, cx, cy, scale, grid_lines, file_format, compression)
+        forget = partial(asyncio.get_running_loop().call_soon_threadsafe, self.forget_world)
+        return key, self.chunk_pool, render_chunk, (seed, cx, cy, scale, grid_lines, file_format, compression,
+                                                    forget)
+
+    def forget_world(self, seed):
+        self.cache.discard(lambda key: key[0] == 'chunk' and key[2] == seed)
+
+    async def compute(self, key, executor, job, args):
+        loop = asyncio.get_running_loop()
+        try:
+            data = None
+            on_disk = self.cache.directory and key[0] == 'map'
+            if on_disk:
+                data = await loop.run_in_executor(None, self.cache.load, key)
+            if data is None:
+                self.stats['misses'] += 1
+                data = await loop.run_in_executor(executor, job, *args)
+                if on_disk:
+                    loop.run_in_executor(None, self.cache.store, key, data)
+            else:
+                self.stats['disk_hits'] += 1
+            self.cache.put(key, data)
+            return data
+        finally:
+            del self.inflight[key]
+
+    async def fetch(self, key, executor, job, args):
+        data = self.cache.get(key)
+        if data is not None:
+            self.stats['hits'] += 1
+            return data
+        task = self.inflight.get(key)
+        if task is None:
+            # Генерация - отдельная задача: если клиент отключится, её
+            # результат всё равно достанется остальным и попадёт в кеш
+            task = self.inflight[key] = asyncio.ensure_future(self.compute(key, executor, job, args))
+        else:
+            self.stats['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    async def respond(self, method, target):
+        if method != 'GET':
+            return HTTPStatus.METHOD_NOT_ALLOWED, 'text/plain; charset=utf-8', "только GET".encode()
+        url = urlsplit(target)
+        if url.path == '/stats':
+            stats = dict(self.stats, cached=len(self.cache.entries), cache_bytes=self.cache.size,
+                         inflight=len(self.inflight))
+            return HTTPStatus.OK, 'application/json', json.dumps(stats).encode()
+
+        query = parse_qs(url.query)
+        try:
+            route = self.route(url.path, query)
+        except ValueError as error:
+            return HTTPStatus.BAD_REQUEST, 'text/plain; charset=utf-8', str(error).encode()
+        if route is None:
+            return HTTPStatus.NOT_FOUND, 'text/plain; charset=utf-8', "нет такого адреса".encode()
+
+        key, executor, job, args = route
+        try:
+            data = await self.fetch(key, executor, job, args)
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, 'text/plain; charset=utf-8', repr(error).encode()
+        return HTTPStatus.OK, CONTENT_TYPES[key[-2]], data
+
+    async def handle(self, reader, writer):
+        # HTTP/1.1 с keep-alive: запросы одного соединения обрабатываются по очереди
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip().lower()
+
+                status, content_type, body = await self.respond(method, target)
+                connection = headers.get('connection', 'keep-alive' if version == 'HTTP/1.1' else 'close')
+                keep_alive = connection == 'keep-alive'
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: {content_type}\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1'))
+                writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.map_pool.shutdown(cancel_futures=True)
+        self.chunk_pool.shutdown(cancel_futures=True)
+
+
+async def serve(host, port, cache, workers):
+    server = MapServer(cache, workers)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Сервер карт: http://{host}:{port}/map?seed=1")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный HTTP-сервер карт и чанков WFC")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес для подключений")
+    parser.add_argument('--port', type=int, default=8765, help="порт")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="число процессов генерации (по умолчанию - по числу ядер)")
+    parser.add_argument('--cache-mb', type=float, default=256, help="размер кеша ответов в памяти, МБ")
+    parser.add_argument('--cache-dir', default=None, help="папка дискового кеша карт (по умолчанию без него)")
+    parser.add_argument('--disk-cache-mb', type=float, default=2048, help="размер дискового кеша, МБ")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers <= 0:
+        parser.error("--workers должен быть положительным")
+    if args.cache_mb < 0 or args.disk_cache_mb < 0:
+        parser.error("размер кеша не может быть отрицательным")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = ResultCache(int(args.cache_mb * 2 ** 20), args.cache_dir, int(args.disk_cache_mb * 2 ** 20))
+    try:
+        asyncio.run(serve(args.host, args.port, cache, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from array import array
+
+# Топологии сетки для WFCGenerator. Клетки пронумерованы подряд (x меняется быстрее
+# всего, затем y, затем z), соседи заранее сложены в плоскую таблицу:
+# neighbors[cell * degree + d] - номер соседа клетки cell в направлении d или -1 за краем.
+# Решатель не знает, какая перед ним сетка: он ходит по таблице и берёт правила
+# соседства для направления d (см. Ruleset.allowed_in() в WFC_ruleset.py)
+
+# Противоположные направления: правило "B справа от A" - то же, что "A слева от B"
+OPPOSITE = {
+    'left': 'right', 'right': 'left', 'up': 'down', 'down': 'up',
+    'up-left': 'down-right', 'down-right': 'up-left', 'up-right': 'down-left', 'down-left': 'up-right',
+    'above': 'below', 'below': 'above',
+}
+
+# Шаги (dx, dy) до соседей на квадратной сетке в порядке SquareGrid.directions:
+# влево, вправо, вверх, вниз. Ими же ходят модули, которые работают с сеткой напрямую
+# (дороги WFC_roads.py, правила WFC_rules.py, перекрывающаяся модель WFC_overlap.py)
+SQUARE_STEPS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+# Шестиугольная сетка со сдвигом нечётных строк вправо: у клетки по два соседа
+# в своей строке и в строках выше и ниже. Смещения (dx, dy) зависят от чётности строки
+HEX_DIRECTIONS = ['left', 'right', 'up-left', 'up-right', 'down-left', 'down-right']
+HEX_OFFSETS = {
+    0: [(-1, 0), (1, 0), (-1, -1), (0, -1), (-1, 1), (0, 1)],
+    1: [(-1, 0), (1, 0), (0, -1), (1, -1), (0, 1), (1, 1)],
+}
+
+
+class Topology:
+    # Общая часть всех сеток. Подклассы задают directions, shape и offsets(y, z) -
+    # смещения (dx, dy, dz) по направлениям для строки (y, z), name - имя в TOPOLOGIES
+    name = None
+    directions = []
+    # Можно ли на сетке прокладывать дороги WFC_roads.py и применять правила WFC_rules.py:
+    # оба работают с квадратной сеткой и четырьмя соседями
+    planar = False
+
+    def __init__(self, width, height, depth=1):
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.size = width * height * depth
+        self.degree = len(self.directions)
+        self.opposite = [self.directions.index(OPPOSITE[name]) for name in self.directions]
+        self.neighbors = self.build_neighbors()
+
+    def direction(self, name):
+        return self.directions.index(name)
+
+    def index(self, x, y, z=0):
+        return (z * self.height + y) * self.width + x
+
+    def coords(self, cell):
+        # Координаты клетки: (x, y) для плоских сеток, (x, y, z) для объёмных
+        rest, x = divmod(cell, self.width)
+        z, y = divmod(rest, self.height)
+        return (x, y, z) if self.depth > 1 else (x, y)
+
+    def offsets(self, y, z):
+        raise NotImplementedError
+
+    def build_neighbors(self):
+        # Таблица заполняется срезами: для каждой строки (y, z) и направления
+        # соседи всей строки копируются одним присваиванием с шагом degree
+        # из массива номеров всех клеток
+        width, degree = self.width, self.degree
+        table = array('i', [-1]) * (self.size * degree)
+        cells = array('i', range(self.size))
+        for z in range(self.depth):
+            for y in range(self.height):
+                row = self.index(0, y, z)
+                for d, (dx, dy, dz) in enumerate(self.offsets(y, z)):
+                    ny, nz = y + dy, z + dz
+                    if not (0 <= ny < self.height and 0 <= nz < self.depth):
+                        continue
+                    first, last = max(0, -dx), min(width, width - dx)
+                    if first >= last:
+                        continue
+                    target = self.index(first + dx, ny, nz)
+                    table[(row + first) * degree + d:(row + last) * degree + d:degree] = \
+                        cells[target:target + last - first]
+        return table
+
+
+class SquareGrid(Topology):
+    # Квадратная сетка: 4 соседа по сторонам или 8 вместе с диагоналями
+
+    def __init__(self, width, height, diagonal=False):
+        self.directions = ['left', 'right', 'up', 'down']
+        self.steps = list(SQUARE_STEPS)
+        if diagonal:
+            self.directions += ['up-left', 'up-right', 'down-left', 'down-right']
+            self.steps += [(-1, -1), (1, -1), (-1, 1), (1, 1)]
+        self.planar = not diagonal
+        self.name = 'square8' if diagonal else 'square4'
+        super().__init__(width, height)
+
+    def offsets(self, y, z):
+        return [(dx, dy, 0) for dx, dy in self.steps]
+
+
+class HexGrid(Topology):
+    name = 'hex'
+    directions = HEX_DIRECTIONS
+
+    def offsets(self, y, z):
+        return [(dx, dy, 0) for dx, dy in HEX_OFFSETS[y % 2]]
+
+
+class VoxelGrid(Topology):
+    # Объём width x height x depth: 4 соседа в слое и по одному сверху и снизу (z + 1 - выше)
+    name = 'voxel'
+    directions = ['left', 'right', 'up', 'down', 'below', 'above']
+
+    def offsets(self, y, z):
+        return [(-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1)]
+
+
+# Топологии по именам для WFC_cli.py и модулей генераторов
+TOPOLOGIES = {
+    'square4': lambda width, height, depth: SquareGrid(width, height),
+    'square8': lambda width, height, depth: SquareGrid(width, height, diagonal=True),
+    'hex': lambda width, height, depth: HexGrid(width, height),
+    'voxel': lambda width, height, depth: VoxelGrid(width, height, depth),
+}
+
+
+def make_topology(name, width, height, depth=1):
+    return TOPOLOGIES[name](width, height, depth)
@@ -0,0 +1,149 @@
+import json
+import time
+from collections import Counter, defaultdict
+
+# Трассировка решателя WFCGenerator (WFC_generator.py). Генератор вызывает методы
+# SolverTrace, только если трассировка включена (generator.trace не None),
+# иначе от неё остаются лишь проверки на None.
+#
+#   trace = WFC_trace.SolverTrace()
+#   generator = WFC_generator.WFCGenerator(ruleset, 200, 200, seed=1, trace=trace)
+#   generator.run()
+#   trace.write_summary('map.stats.json', generator)
+#   trace.write_chrome('map.trace.json')   - открыть в chrome://tracing или Perfetto
+
+# Сколько шагов решателя объединяется в одно событие таймлайна: событие на каждый
+# шаг раздуло бы файл большой карты до сотен мегабайт
+TRACE_BATCH = 1000
+# Не больше стольких отдельных событий fallback и отката в таймлайне (счётчики считают все)
+MAX_INSTANT_EVENTS = 10000
+# Фазы вне шагов решателя, которые попадают в таймлайн отдельными событиями целиком
+SPAN_PHASES = ('roads', 'post')
+
+
+class SolverTrace:
+
+    def __init__(self, batch=TRACE_BATCH):
+        self.batch = batch
+        self.clock = time.perf_counter
+        self.origin = self.clock()
+
+        self.steps = 0
+        self.pushes = 0
+        self.max_depth = 0
+        self.fallbacks = 0
+        self.backtracks = 0
+        # Маска тайлов, исключённых из домена соседа при распространении -> сколько раз
+        self.reductions = Counter()
+
+        # Время по фазам без вложенности: switch() закрывает текущую фазу и открывает новую.
+        # Распространение внутри других фаз считается отдельно, как фаза propagate
+        self.phase = None
+        self.phase_start = self.origin
+        self.span_start = self.origin
+        self.phase_time = defaultdict(float)
+
+        # Таймлайн в формате Chrome trace events
+        self.events = []
+        self.instant_events = 0
+        self.batch_start = None
+        self.batch_pushes = 0
+        self.batch_phase_time = defaultdict(float)
+
+    def timestamp(self, moment):
+        # Микросекунды от создания трассировки
+        return (moment - self.origin) * 1e6
+
+    def switch(self, phase):
+        # Переключает текущую фазу и возвращает предыдущую
+        now = self.clock()
+        previous = self.phase
+        if previous is not None:
+            elapsed = now - self.phase_start
+            self.phase_time[previous] += elapsed
+            self.batch_phase_time[previous] += elapsed
+        if previous is None and phase in SPAN_PHASES:
+            self.span_start = now
+        elif phase is None and previous in SPAN_PHASES:
+            self.events.append({'name': previous, 'ph': 'X', 'pid': 1, 'tid': 1,
+                                'ts': self.timestamp(self.span_start), 'dur': (now - self.span_start) * 1e6})
+        if self.batch_start is None and phase in ('entropy', 'collapse'):
+            self.batch_start = now
+        self.phase = phase
+        self.phase_start = now
+        return previous
+
+    def pushed(self, depth, removed):
+        # Сосед попал в стек распространения, потеряв тайлы removed
+        self.pushes += 1
+        self.batch_pushes += 1
+        self.reductions[removed] += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def instant(self, name, coords):
+        if self.instant_events < MAX_INSTANT_EVENTS:
+            self.instant_events += 1
+            self.events.append({'name': name, 'ph': 'i', 's': 't', 'pid': 1, 'tid': 1,
+                                'ts': self.timestamp(self.clock()), 'args': dict(zip('xyz', coords))})
+
+    def fallback(self, coords):
+        self.fallbacks += 1
+        self.instant('fallback', coords)
+
+    def backtracked(self, coords):
+        self.backtracks += 1
+        self.instant('backtrack', coords)
+
+    def step_done(self, generator):
+        self.switch(None)
+        self.steps += 1
+        if self.steps % self.batch == 0:
+            self.flush(generator)
+
+    def flush(self, generator):
+        # Закрывает пачку шагов: событие с временем фаз и счётчик нерешённых клеток
+        if self.batch_start is None:
+            return
+        now = self.clock()
+        args = {phase + '_ms': round(seconds * 1000, 3) for phase, seconds in self.batch_phase_time.items()}
+        args['pushes'] = self.batch_pushes
+        self.events.append({'name': 'steps', 'ph': 'X', 'pid': 1, 'tid': 1,
+                            'ts': self.timestamp(self.batch_start), 'dur': (now - self.batch_start) * 1e6,
+                            'args': args})
+        undecided = sum(len(bucket) for bucket in generator.entropy_buckets[2:])
+        self.events.append({'name': 'cells', 'ph': 'C', 'pid': 1, 'tid': 1, 'ts': self.timestamp(now),
+                            'args': {'undecided': undecided, 'backtracks': self.backtracks}})
+        self.batch_start = None
+        self.batch_pushes = 0
+        self.batch_phase_time.clear()
+
+    def summary(self, generator):
+        # Итоговые счётчики одной карты
+        per_tile = Counter()
+        for removed, count in self.reductions.items():
+            for tile, bit in generator.tile_bits.items():
+                if removed & bit:
+                    per_tile[tile] += count
+        return {
+            'width': generator.width,
+            'height': generator.height,
+            'seed': generator.seed,
+            'steps': self.steps,
+            'propagation_pushes': self.pushes,
+            'max_stack_depth': self.max_depth,
+            'fallbacks': self.fallbacks,
+            'backtracks': self.backtracks,
+            # Клетки с нарушенным соседством: остаются, когда бюджет откатов исчерпан
+            'conflict_cells': len(generator.conflicts(range(generator.total_cells))),
+            'domain_reductions': dict(per_tile),
+            'phase_seconds': {phase: round(seconds, 6) for phase, seconds in self.phase_time.items()},
+        }
+
+    def write_summary(self, filename, generator):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(generator), f, indent=2, default=str)
+
+    def write_chrome(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
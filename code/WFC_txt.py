@@ -1,5 +1,12 @@
-import random
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import WFC_generator
+import WFC_mapfile
+import WFC_multires
+import WFC_replay
+import WFC_ruleset
+import WFC_topology
+import WFC_trace
 
 def get_user_input():
     while True:
@@ -13,280 +20,259 @@ def get_user_input():
         except ValueError:
             print("Ошибка: введите целое число.")
 
-GRID_WIDTH, GRID_HEIGHT = get_user_input()
-
-TILE_PERCENTAGE_RANGES = {
-    'G': (15, 25),  # Трава
-    'W': (15, 25),  # Вода
-    'D': (10, 20),  # Земля
-    'F': (10, 20),  # Лес
-    'M': (10, 20),  # Низкие горы
-    'H': (0, 5),    # Высокие горы
-    'R': (0, 5),    # Дорога
-}
-
-tile_adjacency = {
-    'G': ['G', 'W', 'D', 'F', 'M', 'R'],
-    'W': ['W', 'G', 'F'],
-    'D': ['D', 'G', 'R'],
-    'F': ['F', 'G', 'M', 'W'],
-    'M': ['M', 'F', 'G', 'H'],
-    'H': ['H', 'M'],
-    'R': ['R', 'D', 'G'],
-}
-
-tile_types = ['G', 'W', 'D', 'F', 'M', 'H', 'R']
-grid = [[tile_types.copy() for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-total_cells = GRID_WIDTH * GRID_HEIGHT
-
-tile_counts = defaultdict(int)
-road_path_coords = set()
-
-
-def is_collapsed(cell):
-    return len(cell) == 1
-
-
-def update_tile_counts(x, y, new_tile, old_tiles):
-    if is_collapsed(old_tiles):
-        old_tile = old_tiles[0]
-        tile_counts[old_tile] -= 1
-    tile_counts[new_tile] += 1
-
-
-def check_percentage_limits(tile_type):
-    if tile_type not in TILE_PERCENTAGE_RANGES:
-        return True
-
-    current_percent = (tile_counts[tile_type] / total_cells) * 100
-    min_p, max_p = TILE_PERCENTAGE_RANGES[tile_type]
-
-    return current_percent < max_p
-
-
-def get_available_tiles(x, y):
-    options = grid[y][x]
-
-    if is_collapsed(options):
-        return options
-
-    if (x, y) not in road_path_coords:
-        options = [tile for tile in options if tile != 'R']
-
-    available_tiles = [tile for tile in options if check_percentage_limits(tile)]
+# Размер карты при запуске скрипта - из get_user_input(),
+# при пакетной генерации - из аргументов WFC_cli.py
+GRID_WIDTH, GRID_HEIGHT = 0, 0
 
-    if not available_tiles:
-        return options
+# Движок генерации: 'python' - пошаговый решатель WFCGenerator из WFC_generator.py,
+# 'numpy' - векторный движок из WFC_numpy.py (нужен numpy)
+ENGINE = 'python'
 
-    return available_tiles
+# Параллельная генерация: число процессов (0 - всё в одном процессе),
+# сторона блока, который решает один процесс, и полуширина полосы вдоль
+# швов между блоками, которая потом перерешивается заново
+PARALLEL_WORKERS = 0
+PARALLEL_BLOCK = 128
+SEAM_WIDTH = 2
 
+# Сколько городов внутри карты соединяет дорожная сеть, кроме концов дороги
+# на верхнем и нижнем краю (0 - одна дорога сверху вниз)
+ROAD_TOWNS = 0
 
-def convert_to_high_mountains():
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if is_collapsed(grid[y][x]) and grid[y][x][0] == 'M':
-                surrounded = True
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT:
-                        if not is_collapsed(grid[ny][nx]) or grid[ny][nx][0] not in ['M', 'H']:
-                            surrounded = False
-                            break
+# Трассировка решателя (WFC_trace.py): счётчики и таймлайн карты из generate_map(),
+# сохраняются через save_trace(). Блоки параллельной генерации и движок numpy не трассируются
+TRACE = False
 
-                if surrounded:
-                    grid[y][x] = ['H']
-                    tile_counts['M'] -= 1
-                    tile_counts['H'] += 1
+# Топология сетки (WFC_topology.py): 'square4', 'square8' или 'hex'. Дороги, постобработка,
+# параллельная генерация и движок numpy есть только у квадратной сетки с 4 соседями
+TOPOLOGY = 'square4'
 
+# Многоуровневая генерация (WFC_multires.py): сколько грубых уровней решается
+# перед картой, каждый вдвое мельче следующего; 0 - карта решается сразу.
+# Только для движка python на сетке square4 без параллельной генерации
+MULTIRES_LEVELS = 0
 
-def convert_water_to_sand():
-    water_to_sand = []
+# Журнал коллапсов (WFC_replay.py) карты из generate_map(), сохраняется через save_log().
+# Пишется только для движка python без параллельной и многоуровневой генерации
+COLLAPSE_LOG = False
 
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if is_collapsed(grid[y][x]) and grid[y][x][0] == 'W':
-                has_road_neighbor = False
-                road_positions = []
+# Тайлы, процентные ограничения, соседство и постобработка - из rulesets/full.json, см. WFC_ruleset.py
+RULESET = WFC_ruleset.load_ruleset('full')
+TILE_PERCENTAGE_RANGES = RULESET.percentage_ranges
+tile_adjacency = RULESET.adjacency
+tile_types = RULESET.tile_types
 
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    nx, ny = x + dx, y + dy
-                    if 0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT:
-                        if is_collapsed(grid[ny][nx]) and grid[ny][nx][0] == 'R':
-                            has_road_neighbor = True
-                            road_positions.append((nx, ny))
+# Всё состояние решателя живёт в WFCGenerator (WFC_generator.py). Здесь - генератор
+# последней карты из generate_map(), с которым работают функции сохранения
+generator = None
+# Журнал коллапсов последней карты, если COLLAPSE_LOG включён
+collapse_log = None
 
-                if has_road_neighbor:
-                    has_water_neighbor = False
-                    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                        nx, ny = x + dx, y + dy
-                        if 0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT:
-                            if is_collapsed(grid[ny][nx]) and grid[ny][nx][0] == 'W':
-                                has_water_neighbor = True
-                                break
+# Размер чанка бесконечного мира и уже сгенерированные чанки: (cx, cy) -> строки тайлов
+CHUNK_SIZE = 32
+chunks = {}
 
-                    if has_water_neighbor:
-                        water_to_sand.append((x, y))
 
-    for x, y in water_to_sand:
-        grid[y][x] = ['S']
-        tile_counts['W'] -= 1
-        tile_counts['S'] += 1
+def map_rows():
+    return generator.map_rows()
 
 
-def collapse_cell(x, y):
-    if is_collapsed(grid[y][x]):
-        return
-
-    options = get_available_tiles(x, y)
-
-    if 'R' in options and too_many_road_neighbors(x, y):
-        options = [opt for opt in options if opt != 'R']
-
-    if not options:
-        options = ['G']  # fallback
-
-    chosen_tile = random.choice(options)
-    old_tiles = grid[y][x].copy()
-    grid[y][x] = [chosen_tile]
-    update_tile_counts(x, y, chosen_tile, old_tiles)
-
+def save_map_to_file(filename="generated_map.txt"):
+    with open(filename, 'w') as f:
+        f.write('\n'.join(map_rows()) + '\n')
+    print(f"Карта успешно сохранена в файл {filename}")
 
-def get_neighbors(x, y):
-    neighbors = []
-    if x > 0: neighbors.append((x - 1, y))
-    if x < GRID_WIDTH - 1: neighbors.append((x + 1, y))
-    if y > 0: neighbors.append((x, y - 1))
-    if y < GRID_HEIGHT - 1: neighbors.append((x, y + 1))
-    return neighbors
 
+def map_binary(compression='zlib'):
+    # Компактный двоичный формат, см. WFC_mapfile.py
+    rules_hash = WFC_mapfile.ruleset_hash(tile_types, tile_adjacency, TILE_PERCENTAGE_RANGES)
+    return WFC_mapfile.encode_map(map_rows(), tile_types + ['S', '?'], generator.seed, rules_hash, compression)
 
-def propagate(x, y):
-    stack = [(x, y)]
-    while stack:
-        cx, cy = stack.pop()
-        current_options = grid[cy][cx]
 
-        for nx, ny in get_neighbors(cx, cy):
-            neighbor_options = grid[ny][nx]
+def save_map_binary(filename="generated_map.wfcm", compression='zlib'):
+    with open(filename, 'wb') as f:
+        f.write(map_binary(compression))
+    print(f"Карта успешно сохранена в файл {filename}")
 
-            if is_collapsed(neighbor_options):
-                continue
 
-            valid_neighbor_tiles = set()
-            for neighbor_tile in neighbor_options:
-                compatible = any(
-                    neighbor_tile in tile_adjacency.get(option, []) for option in current_options
-                )
-                if compatible:
-                    valid_neighbor_tiles.add(neighbor_tile)
-
-            if valid_neighbor_tiles and valid_neighbor_tiles != set(neighbor_options):
-                grid[ny][nx] = list(valid_neighbor_tiles)
-                stack.append((nx, ny))
-
-
-def generate_road_path():
-    start = (random.randint(0, GRID_WIDTH - 1), 0)
-    end = (random.randint(0, GRID_WIDTH - 1), GRID_HEIGHT - 1)
-
-    path = [start]
-    x, y = start
-
-    while (x, y) != end:
-        moves = []
-        if y < end[1]:
-            moves.append((x, y + 1))
-        if x > end[0]:
-            moves.append((x - 1, y))
-        if x < end[0]:
-            moves.append((x + 1, y))
-
-        next_cell = random.choice(moves)
-        if next_cell not in path:
-            path.append(next_cell)
-            x, y = next_cell
-        else:
-            break
-
-    return path
-
-
-def place_road(path):
-    global road_path_coords
-    road_path_coords = set(path)
-    for (x, y) in path:
-        grid[y][x] = ['R']
-        tile_counts['R'] += 1
-
-
-def too_many_road_neighbors(x, y):
-    count = 0
-    for nx, ny in get_neighbors(x, y):
-        if is_collapsed(grid[ny][nx]) and grid[ny][nx][0] == 'R':
-            count += 1
-    return count >= 2
-
-
-def find_lowest_entropy_cell():
-    min_entropy = float('inf')
-    candidates = []
-
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            options = grid[y][x]
-            if not is_collapsed(options):
-                entropy = len(options)
-                if entropy < min_entropy:
-                    min_entropy = entropy
-                    candidates = [(x, y)]
-                elif entropy == min_entropy:
-                    candidates.append((x, y))
-
-    return random.choice(candidates) if candidates else None
-
-
-def run_wfc_step():
-    cell = find_lowest_entropy_cell()
-    if cell:
-        x, y = cell
-        collapse_cell(x, y)
-        propagate(x, y)
-        return True
-    return False
+def save_trace(filename="generated_map.txt"):
+    # Сводка счётчиков в <filename>.stats.json и таймлайн для chrome://tracing в <filename>.trace.json
+    generator.trace.write_summary(filename + '.stats.json', generator)
+    generator.trace.write_chrome(filename + '.trace.json')
+    print(f"Трассировка сохранена в {filename}.stats.json и {filename}.trace.json")
 
 
-def save_map_to_file(filename="generated_map.txt"):
-    with open(filename, 'w') as f:
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                tile = grid[y][x][0] if grid[y][x] else '?'
-                f.write(tile)
-            f.write('\n')
-    print(f"Карта успешно сохранена в файл {filename}")
+def save_log(filename="generated_map.txt"):
+    # Журнал коллапсов в <filename>.wfcl: python WFC_replay.py или python WFC.py <filename>.wfcl
+    size = collapse_log.write(filename + '.wfcl')
+    print(f"Журнал коллапсов сохранён в {filename}.wfcl ({size} байт, {collapse_log.steps} шагов)")
 
 
 def print_tile_percentages():
     print("\nCurrent tile percentages:")
     for tile in TILE_PERCENTAGE_RANGES:
-        percent = (tile_counts[tile] / total_cells) * 100
+        percent = (generator.tile_counts[tile] / generator.total_cells) * 100
         print(f"{tile}: {percent:.1f}%")
     print()
 
 
-def main():
-    print(f"Генерация карты размером {GRID_WIDTH}x{GRID_HEIGHT}...")
-    road_path = generate_road_path()
-    place_road(road_path)
+def generate_chunk(cx, cy, seed, world=None):
+    # Генерирует чанк (cx, cy) мира с зерном seed. Случайность чанка зависит только
+    # от seed и координат, а края уже готовых соседних чанков служат ограничениями.
+    # world - словарь готовых чанков мира, по умолчанию общий chunks.
+    # Чанк, зажатый соседями с нескольких сторон, может прийти к противоречию на шве:
+    # тогда полоса вокруг него решается заново (WFCGenerator.resolve(), как при правке
+    # карты) с теми же ограничениями краёв, а соседние чанки не меняются.
+    # Углы чанка ещё и сужаются под угол готового чанка по диагонали, если между ними
+    # нет готового чанка: иначе клетке будущего чанка между двумя углами могло бы
+    # не найтись тайла, подходящего к обоим
+    if world is None:
+        world = chunks
+    chunk = WFC_generator.WFCGenerator(RULESET, CHUNK_SIZE, CHUNK_SIZE, f"{seed}:{cx}:{cy}", roads=False)
+    last = CHUNK_SIZE - 1
+
+    left = world.get((cx - 1, cy))
+    right = world.get((cx + 1, cy))
+    top = world.get((cx, cy - 1))
+    bottom = world.get((cx, cy + 1))
+    for i in range(CHUNK_SIZE):
+        if left:
+            chunk.constrain(0, i, left[i][last], 'left')
+        if right:
+            chunk.constrain(last, i, right[i][0], 'right')
+        if top:
+            chunk.constrain(i, 0, top[last][i], 'up')
+        if bottom:
+            chunk.constrain(i, last, bottom[0][i], 'down')
+    for dx, dy in ((-1, -1), (1, -1), (-1, 1), (1, 1)):
+        diagonal = world.get((cx + dx, cy + dy))
+        if not diagonal:
+            continue
+        x, y = (0 if dx < 0 else last), (0 if dy < 0 else last)
+        tile = diagonal[last if dy < 0 else 0][last if dx < 0 else 0]
+        horizontal, vertical = ('left' if dx < 0 else 'right'), ('up' if dy < 0 else 'down')
+        if (cx + dx, cy) not in world:
+            chunk.constrain_through(x, y, tile, horizontal, vertical)
+        if (cx, cy + dy) not in world:
+            chunk.constrain_through(x, y, tile, vertical, horizontal)
+
+    while chunk.step():
+        pass
+    broken = chunk.conflicts(range(chunk.total_cells))
+    if broken:
+        chunk.resolve(broken | chunk.halo(broken, WFC_generator.EDIT_HALO))
+
+    rows = chunk.map_rows()
+    world[(cx, cy)] = rows
+    return rows
+
+
+def get_chunk(cx, cy, seed, world=None):
+    # Чанк генерируется только при первом обращении
+    if world is None:
+        world = chunks
+    if (cx, cy) not in world:
+        generate_chunk(cx, cy, seed, world)
+    return world[(cx, cy)]
+
+
+def unload_chunk(cx, cy):
+    chunks.pop((cx, cy), None)
+
+
+def solve_region(width, height, seed, road_cells):
+    # Решает один блок большой карты в процессе пула
+    region = WFC_generator.WFCGenerator(RULESET, width, height, seed, roads=False)
+    if road_cells:
+        region.place_road(road_cells)
+    while region.step():
+        pass
+    return region.grid
+
+
+def generate_parallel(map_generator, road_path):
+    # Делит карту на блоки, решает их в пуле процессов, собирает карту
+    # и перерешивает полосы вдоль швов с учётом соседних блоков
+    width, height = map_generator.width, map_generator.height
+    blocks = [(x0, y0, min(PARALLEL_BLOCK, width - x0), min(PARALLEL_BLOCK, height - y0))
+              for y0 in range(0, height, PARALLEL_BLOCK)
+              for x0 in range(0, width, PARALLEL_BLOCK)]
+
+    grid = [[0] * width for _ in range(height)]
+    with ProcessPoolExecutor(PARALLEL_WORKERS) as pool:
+        futures = []
+        for x0, y0, w, h in blocks:
+            road_cells = [(x - x0, y - y0) for x, y in road_path
+                          if x0 <= x < x0 + w and y0 <= y < y0 + h]
+            futures.append(pool.submit(solve_region, w, h, map_generator.rng.getrandbits(64), road_cells))
+
+        for (x0, y0, w, h), future in zip(blocks, futures):
+            for y, row in enumerate(future.result()):
+                grid[y0 + y][x0:x0 + w] = row
+
+    map_generator.mark_road(road_path)
+    map_generator.load_grid(grid)
+
+    # Полосы вдоль швов (кроме дороги) решаются заново уже с общими счётчиками тайлов
+    seam_cells = set()
+    for x0 in range(PARALLEL_BLOCK, width, PARALLEL_BLOCK):
+        for x in range(max(0, x0 - SEAM_WIDTH), min(width, x0 + SEAM_WIDTH)):
+            seam_cells.update((x, y) for y in range(height))
+    for y0 in range(PARALLEL_BLOCK, height, PARALLEL_BLOCK):
+        for y in range(max(0, y0 - SEAM_WIDTH), min(height, y0 + SEAM_WIDTH)):
+            seam_cells.update((x, y) for x in range(width))
+    map_generator.reopen_cells(seam_cells - set(road_path))
+
+
+def run_numpy_engine(map_generator, road_path):
+    import WFC_numpy
+
+    engine = WFC_numpy.NumpyEngine(RULESET, map_generator.width, map_generator.height,
+                                   seed=map_generator.rng.getrandbits(64))
+    engine.place_road(road_path)
+    engine.run()
+
+    # Забираем результат обратно в генератор, дальше всё как у обычного движка
+    map_generator.mark_road(road_path)
+    map_generator.load_grid(engine.to_grid())
+
+
+def generate_map(width, height, seed=None):
+    # Полный цикл генерации карты без ввода с клавиатуры и без сохранения.
+    # При одинаковом seed карта получается одной и той же
+    global generator, collapse_log
+    trace = WFC_trace.SolverTrace() if TRACE else None
+    collapse_log = None
+    if MULTIRES_LEVELS:
+        generator = WFC_multires.generate(RULESET, width, height, seed, MULTIRES_LEVELS, ROAD_TOWNS, trace=trace)
+        return generator
+    topology = WFC_topology.make_topology(TOPOLOGY, width, height)
+    if COLLAPSE_LOG and ENGINE == 'python' and not PARALLEL_WORKERS:
+        collapse_log = WFC_replay.CollapseLog()
+    generator = WFC_generator.WFCGenerator(RULESET, width, height, seed, ROAD_TOWNS, roads=False, trace=trace,
+                                           topology=topology, log=collapse_log)
+    if not topology.planar:
+        generator.run()
+        return generator
+    road_path = generator.plan_roads()
+
+    if PARALLEL_WORKERS:
+        generate_parallel(generator, road_path)
+    elif ENGINE == 'numpy':
+        run_numpy_engine(generator, road_path)
+    else:
+        generator.place_road(road_path)
+    generator.run()
+    return generator
 
-    while True:
-        if not run_wfc_step():
-            break
 
-    convert_to_high_mountains()
-    convert_water_to_sand()
+def main():
+    print(f"Генерация карты размером {GRID_WIDTH}x{GRID_HEIGHT}...")
+    generate_map(GRID_WIDTH, GRID_HEIGHT)
     save_map_to_file()
     print_tile_percentages()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    GRID_WIDTH, GRID_HEIGHT = get_user_input()
+    main()
@@ -0,0 +1,64 @@
+import WFC_generator
+import WFC_mapfile
+import WFC_ruleset
+import WFC_topology
+
+# Объёмная карта: решатель WFCGenerator на топологии VoxelGrid (WFC_topology.py)
+# с правилами rulesets/voxel.json, где у тайлов свои соседи сверху и снизу.
+# Дорог и постобработки нет: они работают только на плоской квадратной сетке.
+# Карта сохраняется слоями снизу вверх, слои в текстовом файле разделены пустой строкой,
+# в двоичном файле идут подряд (высота в заголовке - height * depth)
+
+# Число слоёв по вертикали; WFC_cli.py задаёт его через --depth
+VOXEL_DEPTH = 64
+
+RULESET = WFC_ruleset.load_ruleset('voxel')
+TILE_PERCENTAGE_RANGES = RULESET.percentage_ranges
+tile_adjacency = RULESET.adjacency
+tile_types = RULESET.tile_types
+
+# Генератор последней карты из generate_map()
+generator = None
+
+
+def generate_map(width, height, seed=None):
+    global generator
+    topology = WFC_topology.VoxelGrid(width, height, VOXEL_DEPTH)
+    generator = WFC_generator.WFCGenerator(RULESET, width, height, seed, topology=topology)
+    generator.run()
+    return generator
+
+
+def map_rows():
+    return generator.map_rows()
+
+
+def map_layers():
+    # Строки карты по слоям: layers[z][y]
+    rows = map_rows()
+    return [rows[z * generator.height:(z + 1) * generator.height] for z in range(generator.depth)]
+
+
+def save_map_to_file(filename="generated_map.txt"):
+    with open(filename, 'w') as f:
+        f.write('\n\n'.join('\n'.join(layer) for layer in map_layers()) + '\n')
+    print(f"Карта успешно сохранена в файл {filename}")
+
+
+def map_binary(compression='zlib'):
+    rules_hash = WFC_mapfile.ruleset_hash(tile_types, tile_adjacency, TILE_PERCENTAGE_RANGES)
+    return WFC_mapfile.encode_map(map_rows(), tile_types + ['?'], generator.seed, rules_hash, compression)
+
+
+def save_map_binary(filename="generated_map.wfcm", compression='zlib'):
+    with open(filename, 'wb') as f:
+        f.write(map_binary(compression))
+    print(f"Карта успешно сохранена в файл {filename}")
+
+
+def print_tile_percentages():
+    print("\nCurrent tile percentages:")
+    for tile in TILE_PERCENTAGE_RANGES:
+        percent = (generator.tile_counts[tile] / generator.total_cells) * 100
+        print(f"{tile}: {percent:.1f}%")
+    print()